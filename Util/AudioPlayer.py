@@ -1,21 +1,200 @@
+import os
 import threading
-import time
 import wave
+from collections import OrderedDict
 import numpy as np
-import sounddevice as sd
+
+from Util import latency_trace
+from Util.audio_backend import SoundDeviceBackend
+from Util.dsp import GainStage, Resampler, convert_channels, measure_loudness, normalization_gain, resample
+
+
+class PCMCache:
+    """ 已解码、已调整音量的 int16 音频缓存, 按字节预算做 LRU 淘汰 """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, audio_data, frame_rate, channels):
+        if audio_data.nbytes > self.max_bytes:
+            return
+        # 缓存中的数组会被多次播放, 禁止修改
+        audio_data.flags.writeable = False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[0].nbytes
+            self.entries[key] = (audio_data, frame_rate, channels)
+            self.total_bytes += audio_data.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (evicted, _, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class RingBuffer:
+    """ 单生产者/单消费者环形缓冲区
+
+    写指针只由生产者(播放线程)修改, 读指针只由消费者(音频回调)修改, 双方都不需要加锁。
+    """
+
+    def __init__(self, capacity, channels):
+        self.buffer = np.zeros((capacity, channels), dtype=np.int16)
+        self.capacity = capacity
+        self.channels = channels
+        self.write_pos = 0
+        self.read_pos = 0
+
+    @property
+    def available(self):
+        """ 尚未播放的帧数 """
+        return self.write_pos - self.read_pos
+
+    @property
+    def free(self):
+        """ 可写入的帧数 """
+        return self.capacity - self.available
+
+    def write(self, data):
+        """ 写入尽可能多的帧, data 形状为 (帧数, 声道数), 单声道 (帧数, 1) 会复制到所有声道, 返回写入帧数 """
+        n = min(len(data), self.free)
+        if n <= 0:
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if n > first:
+            self.buffer[:n - first] = data[first:n]
+        self.write_pos += n
+        return n
+
+    def read_into(self, out):
+        """ 读取最多 len(out) 帧到 out 中, 返回读取的帧数 """
+        n = min(len(out), self.available)
+        if n <= 0:
+            return 0
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if n > first:
+            out[first:n] = self.buffer[:n - first]
+        self.read_pos += n
+        return n
+
+
+class DeviceStream:
+    """ 每个输出设备一条常驻的 OutputStream, 回调从环形缓冲区取数据, 缓冲区为空时输出静音 """
+
+    def __init__(self, backend, device_id, samplerate, channels=2, buffer_seconds=2.0):
+        self.device_id = device_id
+        self.samplerate = samplerate
+        self.channels = channels
+        self.ring = RingBuffer(int(samplerate * buffer_seconds), channels)
+        # 回调每取走一块数据就置位, 供写入方等待空间
+        self.consumed_event = threading.Event()
+        # 由回调执行的丢弃: 读指针跳到丢弃时的写指针位置, 保持读指针只由回调修改;
+        # 只跳过丢弃之前写入的数据, 之后新写入的数据不受影响
+        self.discard_until = 0
+        self.stream = backend.output_stream(samplerate, channels, device_id, self._callback)
+
+    def _callback(self, outdata, frames, time_info, status):
+        discard_until = self.discard_until
+        if discard_until > self.ring.read_pos:
+            self.ring.read_pos = discard_until
+        n = self.ring.read_into(outdata)
+        if n < frames:
+            # 没有数据时输出静音
+            outdata[n:] = 0
+        self.consumed_event.set()
+
+    def start(self):
+        self.stream.start()
+
+    @property
+    def active(self):
+        """ 输出流是否仍在运行, 设备被拔出或音频服务重启后会变为 False """
+        return self.stream.active
+
+    def close(self):
+        try:
+            self.stream.stop()
+            self.stream.close()
+        except Exception as e:
+            print(f"关闭输出流时出错: {e}")
+
+    def _wait_consumed(self):
+        if not self.stream.active:
+            raise RuntimeError(f"设备 {self.device_id} 的输出流已停止")
+        self.consumed_event.wait(0.05)
+        self.consumed_event.clear()
+
+    def write(self, audio_data, cancel_event=None):
+        """ 写入 (帧数, 声道数) 的 int16 数据, 缓冲区满时等待回调取走数据; 被取消时丢弃未播放数据并返回 False """
+        offset = 0
+        while offset < len(audio_data):
+            if cancel_event is not None and cancel_event.is_set():
+                self.discard()
+                return False
+            offset += self.ring.write(audio_data[offset:])
+            if offset < len(audio_data):
+                self._wait_consumed()
+        return True
+
+    def drain(self, cancel_event=None):
+        """ 等待缓冲区中的数据播放完毕; 被取消时丢弃未播放数据并返回 False """
+        while self.ring.available > 0:
+            if cancel_event is not None and cancel_event.is_set():
+                self.discard()
+                return False
+            self._wait_consumed()
+        return True
+
+    def discard(self):
+        """ 丢弃缓冲区中目前尚未播放的数据 """
+        self.discard_until = self.ring.write_pos
 
 
 class AudioPlayer:
-    def __init__(self):
+    def __init__(self, cache_bytes=64 * 1024 * 1024, loudness_target=None, backend=None):
+        # 音频输出后端, 默认使用 sounddevice
+        self.backend = backend if backend is not None else SoundDeviceBackend()
         self.play_Lock = threading.Lock()
-        self.playing_null = False
-        self.null_thread = None
-        self.null_thread_stop_event = threading.Event()  # 用于终止线程的事件
+        self.pcm_cache = PCMCache(cache_bytes)
+        # 增益 + 软限幅, 超出满幅时不再回绕
+        self.gain_stage = GainStage()
+        # 目标响度(LUFS), 为 None 时不做响度归一化
+        self.loudness_target = loudness_target
+        # 文件身份 -> 测得的响度, 每个片段只测量一次
+        self.loudness_cache = {}
+        # 来源(合成引擎) -> 流式音频的响度估计, 由该来源完整片段的实测响度滑动平均得到
+        self.stream_loudness_estimates = {}
+        self.stream_loudness_lock = threading.Lock()
+        # 设备id -> 常驻输出流
+        self.streams = {}
+        self.streams_lock = threading.Lock()
+        # 设备id -> (默认采样率, 声道数), 只查询一次
+        self.device_formats = {}
+        # 置位后正在进行的播放立即停止, 由调用方(播放调度器)负责复位
+        self.interrupt_event = threading.Event()
 
     def get_audio_devices(self):
         """ 获取所有音频输出设备名称与设备id的字典 """
         devices = {}
-        device_info = sd.query_devices()
+        device_info = self.backend.query_devices()
 
         for row in device_info:
             # 判断设备是否支持输出
@@ -24,73 +203,205 @@ class AudioPlayer:
 
         return devices
 
-    def play(self, audio_data, samplerate, device, mapping):
+    def get_device_format(self, device_id):
+        """ 设备的原生格式 (默认采样率, 声道数), 声道数最多为 2 """
+        fmt = self.device_formats.get(device_id)
+        if fmt is None:
+            info = self.backend.query_devices(device_id)
+            fmt = (int(info['default_samplerate']), max(1, min(2, int(info['max_output_channels']))))
+            self.device_formats[device_id] = fmt
+        return fmt
+
+    def open_device(self, device_id):
+        """ 以设备原生格式打开(或复用)常驻输出流, 之后所有音频都转换到这个格式
+
+        输出流已停止(设备被拔出、虚拟声卡重启、系统休眠恢复等)时关闭并重新打开。
+        """
+        with self.streams_lock:
+            stream = self.streams.get(device_id)
+            if stream is not None and not stream.active:
+                print(f"设备 {device_id} 的输出流已停止, 重新打开")
+                stream.close()
+                stream = None
+            if stream is None:
+                samplerate, channels = self.get_device_format(device_id)
+                stream = DeviceStream(self.backend, device_id, samplerate, channels)
+                stream.start()
+                self.streams[device_id] = stream
+            return stream
+
+    def adapt(self, audio_data, samplerate, channels, device_id):
+        """ 将 int16 数据转换为设备原生的采样率和声道数, 返回 (帧数, 声道数) 数组 """
+        device_rate, device_channels = self.get_device_format(device_id)
+        audio_data = audio_data.reshape(-1, channels)
+        if samplerate != device_rate:
+            audio_data = resample(audio_data, samplerate, device_rate)
+        return convert_channels(audio_data, device_channels)
+
+    def close(self):
+        """ 关闭所有输出流 """
+        with self.streams_lock:
+            for stream in self.streams.values():
+                stream.close()
+            self.streams.clear()
+
+    def interrupt(self):
+        """ 打断当前播放 """
+        self.interrupt_event.set()
+
+    def reset_interrupt(self):
+        """ 清除打断标记, 之后的播放正常进行 """
+        self.interrupt_event.clear()
+
+    @property
+    def interrupted(self):
+        return self.interrupt_event.is_set()
+
+    def play(self, audio_data, samplerate, device, channels=1):
+        """ 将 int16 数组写入设备的常驻输出流并等待播放完成, 被打断时返回 False """
+        audio_data = self.adapt(audio_data, samplerate, channels, device)
         with self.play_Lock:
-            sd.play(audio_data, samplerate=samplerate,
-                    device=device, mapping=mapping)
-            sd.wait()
+            stream = self.open_device(device)
+            latency_trace.mark('first_sample')
+            if not stream.write(audio_data, self.interrupt_event):
+                return False
+            drained = stream.drain(self.interrupt_event)
+            latency_trace.mark('playback')
+            return drained
+
+    def load_audio(self, file_path, device_id, volume, loudness=None):
+        """ 读取 wav 文件并转换为可直接写入设备的数组, 结果放入 PCM 缓存, 返回 (数组, 采样率, 声道数)
+
+        loudness 为片段首次流式播放时使用的响度, 指定时按它计算增益, 重播与首次播放的音量一致。
+        """
+        # 以文件身份(路径, 修改时间, 大小)和音量作为缓存键, 文件被替换后自动失效
+        stat = os.stat(file_path)
+        identity = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        key = identity + (volume, self.loudness_target, device_id, loudness)
+        cached = self.pcm_cache.get(key)
+        if cached is not None:
+            latency_trace.mark('pcm_cache_hit')
+            return cached
+        # 打开WAV文件
+        with wave.open(file_path, 'rb') as wf:
+            # 读取音频参数
+            channels = wf.getnchannels()
+            frame_rate = wf.getframerate()
+            frames = wf.readframes(wf.getnframes())
+        if loudness is None:
+            loudness = self.loudness_cache.get(identity)
+        audio_data = self.prepare_pcm(frames, volume, frame_rate, channels, loudness, identity)
+        # 缓存转换为设备原生格式之后的结果
+        audio_data = self.adapt(audio_data, frame_rate, channels, device_id)
+        frame_rate, channels = self.get_device_format(device_id)
+        self.pcm_cache.put(key, audio_data, frame_rate, channels)
+        latency_trace.mark('wav_load')
+        return audio_data, frame_rate, channels
+
+    def play_audio_on_device(self, file_path, device_id, volume, loudness=None):
+        """ 播放指定文件路径的音频到指定的设备, loudness 见 load_audio """
+        try:
+            audio_data, frame_rate, channels = self.load_audio(file_path, device_id, volume, loudness)
+        except Exception as e:
+            print(f"Error playing audio on device {device_id}: {e}")
+            return
+        self.play_prepared(audio_data, frame_rate, channels, device_id)
+
+    def get_gain(self, volume, loudness=None):
+        """ 音量与响度归一化合并后的线性增益 """
+        return volume * normalization_gain(loudness, self.loudness_target)
 
-    def play_audio_on_device(self, file_path, device_id, volume):
-        """ 播放指定文件路径的音频到指定的设备 """
+    def prepare_pcm(self, pcm, volume, frame_rate=None, channels=1, loudness=None, identity=None):
+        """ 16-bit PCM 字节数据转换为调整过音量、可直接播放的 int16 数组
+
+        开启响度归一化时, 未提供响度则先测量; 提供 identity 时测量结果按片段缓存。
+        """
+        # 将字节数据转换为numpy数组
+        audio_data = np.frombuffer(pcm, dtype=np.int16)
+
+        if loudness is None and self.loudness_target is not None and frame_rate:
+            loudness = measure_loudness(audio_data, frame_rate, channels)
+            if identity is not None:
+                self.loudness_cache[identity] = loudness
+
+        # 调整音量(float32 增益 + 软限幅)
+        return self.gain_stage.process(audio_data, self.get_gain(volume, loudness))
+
+    def play_pcm_on_device(self, pcm, frame_rate, channels, device_id, volume):
+        """ 播放内存中的 16-bit PCM 数据到指定的设备 """
+        try:
+            audio_data = self.prepare_pcm(pcm, volume, frame_rate, channels)
+        except Exception as e:
+            print(f"Error playing audio on device {device_id}: {e}")
+            return
+        self.play_prepared(audio_data, frame_rate, channels, device_id)
+
+    def play_prepared(self, audio_data, frame_rate, channels, device_id):
+        """ 播放已调整过音量的 int16 数组 """
         try:
-            # 打开WAV文件
-            with wave.open(file_path, 'rb') as wf:
-                # 读取音频参数
-                channels = wf.getnchannels()
-                width = wf.getsampwidth()
-                frame_rate = wf.getframerate()
-                frames = wf.readframes(wf.getnframes())
-
-                # 将字节数据转换为numpy数组
-                audio_data = np.frombuffer(frames, dtype=np.int16)
-
-                # 调整音量
-                audio_data = audio_data * volume
-                # 格式转换
-                audio_data = audio_data.astype(np.int16)
-                # 播放音频
-                self.frame_rate = frame_rate
-                self.channels = channels
-                self.stop_null()
-                self.play(audio_data, samplerate=frame_rate,
-                          device=device_id, mapping=[1, 2])
-
-                # 音频播放完成后播放空电平信号
-                self.null_thread_stop_event = threading.Event()  # 用于终止线程的事件
-                self.play_null(device_id)
+            # 播放音频
+            self.play(audio_data, samplerate=frame_rate,
+                      device=device_id, channels=channels)
         except Exception as e:
             print(f"Error playing audio on device {device_id}: {e}")
 
-    def play_null(self, device_id):
-        """ 输出空电平重置设备 """
-        if not self.playing_null:
-            self.playing_null = True
-
-            def null_thread_func():
-                for _ in range(100):
-                    if self.null_thread_stop_event.is_set():  # 检查是否需要终止线程
-                        self.playing_null = False
-                        return
-                    duration = 0.1  # 秒
-                    silence_frames = int(
-                        duration * self.frame_rate * self.channels)
-                    silence_data = np.zeros(silence_frames, dtype=np.int16)
-                    # 播放空电平信号
-                    self.play(silence_data, samplerate=self.frame_rate,
-                              device=device_id, mapping=[1, 2])
-                self.playing_null = False
-                print('空电平输出完成', flush=True)
-
-            # 启动空电平信号播放线程
-            self.null_thread = threading.Thread(target=null_thread_func)
-            self.null_thread.start()
-
-    def stop_null(self):
-        """ 终止空电平信号播放线程 """
-        if self.playing_null:
-            self.null_thread_stop_event.set()  # 设置事件以终止线程
-            if self.null_thread.is_alive():
-                self.null_thread.join()  # 等待线程结束
+    def stream_loudness(self, source):
+        """ 来源的流式音频按多大响度处理: 数据流的整体响度事先未知, 使用该来源的响度估计
+
+        还没有估计时视为已达到目标响度(只调整音量); 未开启响度归一化时返回 None。
+        """
+        if self.loudness_target is None:
+            return None
+        with self.stream_loudness_lock:
+            return self.stream_loudness_estimates.get(source, self.loudness_target)
+
+    def update_stream_loudness(self, source, pcm, frame_rate, channels, weight=0.3):
+        """ 用来源一段完整音频的实测响度更新估计, 返回实测响度 """
+        if self.loudness_target is None:
+            return None
+        loudness = measure_loudness(np.frombuffer(pcm, dtype=np.int16), frame_rate, channels)
+        if not np.isfinite(loudness):
+            return loudness
+        with self.stream_loudness_lock:
+            estimate = self.stream_loudness_estimates.get(source)
+            self.stream_loudness_estimates[source] = (
+                loudness if estimate is None else estimate + weight * (loudness - estimate))
+        return loudness
+
+    def play_stream(self, chunks, samplerate, device_id, volume, channels=1, loudness=None):
+        """ 边接收边播放 16-bit PCM 数据流, chunks 为逐块产出 bytes 的可迭代对象
+
+        loudness 为按其计算响度归一化增益的响度(见 stream_loudness), 不指定时只做音量调整和软限幅。
+        """
+        played = 0
+        gain = self.get_gain(volume, loudness)
+        # 复用的输出缓冲区, 数据写入环形缓冲区时会被复制
+        buffer = np.empty(0, dtype=np.int16)
+        try:
+            with self.play_Lock:
+                stream = None
+                device_rate, device_channels = self.get_device_format(device_id)
+                resampler = Resampler(samplerate, device_rate, channels)
+                for chunk in chunks:
+                    audio_data = np.frombuffer(chunk, dtype=np.int16)
+                    if gain != 1.0:
+                        if len(buffer) < len(audio_data):
+                            buffer = np.empty(len(audio_data), dtype=np.int16)
+                        audio_data = self.gain_stage.process(audio_data, gain, buffer[:len(audio_data)])
+                    audio_data = resampler.process(audio_data.reshape(-1, channels))
+                    audio_data = convert_channels(audio_data, device_channels)
+                    if stream is None:
+                        stream = self.open_device(device_id)
+                        latency_trace.mark('first_sample')
+                    if not stream.write(audio_data, self.interrupt_event):
+                        break
+                    played += len(audio_data)
+                if stream is not None:
+                    stream.drain(self.interrupt_event)
+                    latency_trace.mark('playback')
+        except Exception as e:
+            print(f"Error playing stream on device {device_id}: {e}")
+        return played > 0
 
     def play_audio_on_device_async(self, file_path, device_id, volume):
         """ 异步播放指定文件路径的音频到指定的设备 """
@@ -0,0 +1,83 @@
+"""
+缓存预热
+启动后在后台把常用语句逐条合成并解码到缓存中，有交互请求时暂停，空闲一段时间后继续
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List
+
+
+class CachePrewarmer:
+    """低优先级的后台预热任务，始终给交互请求让路"""
+
+    def __init__(self, phrases: List[str], warm: Callable[[str], None], idle_delay: float = 1.0):
+        """
+        初始化预热任务
+
+        Args:
+            phrases: 需要预热的语句
+            warm: 预热单条语句的函数（合成并解码到缓存），在后台线程中调用
+            idle_delay: 最后一个交互请求结束后等待多久（秒）才继续预热
+        """
+        self.phrases = phrases
+        self.warm = warm
+        self.idle_delay = idle_delay
+        self.active = 0
+        self.last_active = 0.0
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    @contextmanager
+    def interactive(self):
+        """交互请求期间预热暂停，用法: with prewarmer.interactive(): ..."""
+        with self.cond:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.last_active = time.monotonic()
+                self.cond.notify_all()
+
+    def start(self):
+        """启动后台预热线程"""
+        if not self.phrases or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='cache-prewarmer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止预热，正在进行的一条会继续完成"""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def _wait_idle(self):
+        """等待没有交互请求且空闲超过 idle_delay，返回是否应继续预热"""
+        with self.cond:
+            while not self.stopped:
+                if self.active:
+                    self.cond.wait()
+                    continue
+                remaining = self.last_active + self.idle_delay - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self.cond.wait(remaining)
+            return False
+
+    def _run(self):
+        start_time = time.time()
+        warmed = 0
+        for phrase in self.phrases:
+            if not self._wait_idle():
+                return
+            try:
+                self.warm(phrase)
+                warmed += 1
+            except Exception as e:
+                print(f"预热失败: {phrase[:20]}: {e}")
+        print(f"缓存预热完成: {warmed}/{len(self.phrases)} 条, 耗时 {time.time() - start_time:.1f} 秒")
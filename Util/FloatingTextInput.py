@@ -18,7 +18,11 @@ else:
 
 
 class FloatingTextInput:
-    """悬浮文本输入窗口"""
+    """悬浮文本输入窗口
+
+    窗口只创建一次，由专用的界面线程持有并运行 mainloop，显示和隐藏只是 deiconify/withdraw。
+    其他线程对窗口的操作都通过 root.after 交给界面线程执行。
+    """
     
     def __init__(self, callback: Callable[[str], None], hotkey_manager=None):
         """
@@ -34,6 +38,33 @@ class FloatingTextInput:
         self.entry = None
         self.is_visible = False
         self.window_thread = None
+        self.ready = threading.Event()
+        # 按下热键的时间，输入框获得焦点后清空，用于统计 热键 -> 可输入 的延迟
+        self.show_requested_at = None
+        self.focus_attempts = 0
+        self.game_mode = False
+        self.start()
+        
+    def start(self):
+        """启动界面线程，创建窗口后保持隐藏"""
+        if self.window_thread is not None and self.window_thread.is_alive():
+            return
+        self.ready.clear()
+        
+        def run_window():
+            try:
+                self.create_window()
+                self.root.withdraw()
+            except Exception as e:
+                print(f"创建悬浮窗时出错: {e}")
+                self.root = None
+                return
+            finally:
+                self.ready.set()
+            self.root.mainloop()
+        
+        self.window_thread = threading.Thread(target=run_window, name='floating-input-ui', daemon=True)
+        self.window_thread.start()
         
     def create_window(self):
         """创建悬浮窗"""
@@ -140,21 +171,50 @@ class FloatingTextInput:
         self.entry.bind('<Control-a>', lambda e: self.entry.select_range(0, tk.END))  # Ctrl+A 全选
         self.entry.bind('<Control-d>', lambda e: self.clear_entry())  # Ctrl+D 清空输入框
 
-        # 绑定窗口焦点事件
+        # 绑定窗口焦点事件：窗口映射完成后设置输入框焦点，输入框获得焦点即确认成功
         self.root.bind('<FocusOut>', self.on_focus_out)
+        self.root.bind('<Map>', self.on_map)
+        self.entry.bind('<FocusIn>', self.on_entry_focus)
         
         # 居中显示
         self.center_window()
         
-        # 强制窗口获得焦点和置顶
-        self.force_focus()
-        
+    # 焦点被抢走后重新激活的最多次数
+    MAX_FOCUS_ATTEMPTS = 3
+    
+    def on_map(self, event):
+        """窗口映射到屏幕后才能可靠地获得焦点"""
+        if event.widget == self.root and self.show_requested_at is not None:
+            self.set_entry_focus()
+    
+    def on_entry_focus(self, event):
+        """输入框获得焦点，记录 热键 -> 可输入 的延迟"""
+        if self.show_requested_at is None:
+            return
+        latency = (time.perf_counter() - self.show_requested_at) * 1000
+        self.show_requested_at = None
+        print(f"悬浮窗输入框已获得焦点，热键到可输入耗时 {latency:.0f} ms（尝试 {self.focus_attempts} 次）")
+    
     def on_focus_out(self, event):
         """窗口失去焦点时的处理（可选：自动关闭）"""
         # 注释掉自动关闭功能，避免误操作
         # if event.widget == self.root:
         #     self.hide()
-        pass
+        # 显示过程中焦点被游戏抢回时重新激活，次数有限，不再定时反复重试
+        if (self.show_requested_at is not None and self.is_visible
+                and self.focus_attempts < self.MAX_FOCUS_ATTEMPTS):
+            self.root.after_idle(self.force_focus)
+    
+    def set_entry_focus(self):
+        """设置输入框焦点并选中已有文本"""
+        try:
+            if self.entry and self.root:
+                self.entry.focus_set()
+                self.entry.icursor(tk.END)  # 将光标移到输入框末尾
+                # 选中所有现有文本（如果有的话）
+                self.entry.select_range(0, tk.END)
+        except Exception as e:
+            print(f"设置输入框焦点失败: {e}")
     
     def clear_entry(self):
         """清空输入框"""
@@ -206,10 +266,10 @@ class FloatingTextInput:
             return False
     
     def force_focus(self):
-        """强制窗口获得焦点"""
+        """强制窗口获得焦点（在界面线程中调用）"""
+        self.focus_attempts += 1
         try:
-            # 检测是否有全屏应用
-            is_game_mode = self.is_fullscreen_app_active()
+            is_game_mode = self.game_mode
             
             # 确保窗口可见并置顶
             self.root.deiconify()
@@ -275,32 +335,8 @@ class FloatingTextInput:
                 self.root.grab_set()  # 模态窗口，抢夺所有输入
                 print("启用模态输入抢夺")
             
-            # 延迟设置输入框焦点，确保窗口完全加载
-            def set_entry_focus():
-                try:
-                    if self.entry and self.root:
-                        self.entry.focus_set()
-                        self.entry.icursor(tk.END)  # 将光标移到输入框末尾
-                        # 选中所有现有文本（如果有的话）
-                        self.entry.select_range(0, tk.END)
-                        # print("输入框焦点设置成功")
-                except Exception as e:
-                    print(f"设置输入框焦点失败: {e}")
-            
-            # 根据模式调整重试时间
-            if is_game_mode:
-                # 游戏模式需要更多时间来抢夺焦点
-                self.root.after(10, set_entry_focus)
-                self.root.after(50, set_entry_focus)
-                self.root.after(100, set_entry_focus)
-                self.root.after(200, set_entry_focus)
-                self.root.after(400, set_entry_focus)
-                self.root.after(800, set_entry_focus)
-            else:
-                # 桌面模式可以更快设置焦点
-                self.root.after(10, set_entry_focus)
-                self.root.after(50, set_entry_focus)
-                self.root.after(150, set_entry_focus)
+            # 输入框焦点在 <Map> 事件或这里设置，成功与否由 <FocusIn> 事件确认
+            self.set_entry_focus()
             
         except Exception as e:
             print(f"设置窗口焦点时出错: {e}")
@@ -323,72 +359,75 @@ class FloatingTextInput:
         self.hide()
         
     def show(self):
-        """显示悬浮窗"""
+        """显示悬浮窗（可在任意线程调用）"""
+        requested_at = time.perf_counter()
         print("尝试显示悬浮输入窗口...")
         
+        if not self.ready.wait(timeout=5) or self.root is None:
+            print("悬浮窗未能创建，无法显示")
+            return
+        
         if self.is_visible:
             # 如果窗口已经显示，重新获得焦点
             print("窗口已存在，重新获取焦点...")
-            if self.root and self.entry:
-                self.force_focus()
+            self.root.after(0, self.force_focus)
             return
             
         self.is_visible = True
-        print("开始创建新的悬浮窗口...")
         
         # 临时禁用全局热键，避免冲突
         if self.hotkey_manager:
             self.hotkey_manager.pause()
             print("全局热键已暂停")
         
-        # 在新线程中创建并显示窗口
-        def run_window():
-            try:
-                self.create_window()
-                print("悬浮窗口创建完成，正在设置焦点...")
-                # 确保窗口在创建后获得焦点
-                self.root.after(10, self.force_focus)
-                self.root.mainloop()
-            except Exception as e:
-                print(f"显示悬浮窗时出错: {e}")
-                self.hide()
-                
-        self.window_thread = threading.Thread(target=run_window, daemon=True)
-        self.window_thread.start()
+        # 检测全屏应用不涉及 Tk，在调用线程中完成
+        self.game_mode = self.is_fullscreen_app_active()
+        
+        def show_window():
+            self.show_requested_at = requested_at
+            self.focus_attempts = 0
+            self.force_focus()
+        
+        self.root.after(0, show_window)
         
     def hide(self):
-        """隐藏悬浮窗"""
+        """隐藏悬浮窗（可在任意线程调用），窗口保留以便下次立即显示"""
         if not self.is_visible:
             return
             
         self.is_visible = False
+        self.show_requested_at = None
         
         # 重新启用全局热键
         if self.hotkey_manager:
             self.hotkey_manager.resume()
         
         if self.root:
+            self.root.after(0, self.withdraw_window)
+    
+    def withdraw_window(self):
+        try:
+            # 释放模态抢夺（如果有的话）
             try:
-                # 释放模态抢夺（如果有的话）
-                try:
-                    self.root.grab_release()
-                    print("释放模态输入抢夺")
-                except:
-                    pass
-                
-                # 隐藏窗口前先取消置顶属性，让系统自然恢复焦点
-                self.root.attributes('-topmost', False)
-                
-                # 给系统一点时间来处理焦点转换
-                time.sleep(0.1)
-                
-                self.root.quit()
-                self.root.destroy()
-                print("悬浮窗已关闭，焦点应已返回游戏")
-            except Exception as e:
-                print(f"关闭悬浮窗时出错: {e}")
-            self.root = None
-            self.entry = None
+                self.root.grab_release()
+            except:
+                pass
+            
+            # 隐藏窗口前先取消置顶属性，让系统自然恢复焦点
+            self.root.attributes('-topmost', False)
+            self.root.withdraw()
+            print("悬浮窗已隐藏，焦点应已返回游戏")
+        except Exception as e:
+            print(f"隐藏悬浮窗时出错: {e}")
+    
+    def close(self):
+        """销毁窗口并结束界面线程"""
+        self.hide()
+        if self.root:
+            try:
+                self.root.after(0, self.root.quit)
+            except Exception:
+                pass
             
     def is_showing(self):
         """检查悬浮窗是否正在显示"""
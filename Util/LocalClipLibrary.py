@@ -0,0 +1,108 @@
+"""
+本地音频片段索引
+启动时扫描 ./local 目录建立 规范化文本 -> 文件路径 的索引，后台轮询目录修改时间增量更新
+"""
+
+import os
+import threading
+import unicodedata
+from typing import Dict, Optional
+
+
+class LocalClipLibrary:
+    """./local 目录下 wav 片段的索引，查询为一次字典访问"""
+
+    def __init__(self, directory='./local', poll_interval=2.0):
+        """
+        初始化索引
+
+        Args:
+            directory: 片段所在目录
+            poll_interval: 检查目录变化的间隔（秒）
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.index: Dict[str, str] = {}
+        # 文件名 -> 规范化键，用于增量更新
+        self.files: Dict[str, str] = {}
+        self.dir_mtime = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.poll_thread = None
+        self.refresh()
+
+    @staticmethod
+    def normalize(text):
+        """规范化文本：去除首尾空白，统一全角/半角与大小写，忽略标点和空白"""
+        text = unicodedata.normalize('NFKC', text).strip().casefold()
+        key = ''.join(ch for ch in text
+                      if not unicodedata.category(ch).startswith(('P', 'Z')) and not ch.isspace())
+        # 全部由标点组成的文本（如 "?"）保留原样
+        return key or text
+
+    def lookup(self, text) -> Optional[str]:
+        """查询文本对应的片段路径，不存在时返回 None"""
+        return self.index.get(self.normalize(text))
+
+    def refresh(self):
+        """目录修改时间变化时增量更新索引，返回索引是否发生变化"""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.dir_mtime:
+            return False
+
+        try:
+            names = {entry.name for entry in os.scandir(self.directory)
+                     if entry.is_file() and entry.name.lower().endswith('.wav')}
+        except FileNotFoundError:
+            names = set()
+
+        with self.lock:
+            self.dir_mtime = mtime
+            removed = self.files.keys() - names
+            added = names - self.files.keys()
+            if not removed and not added:
+                return False
+            index = dict(self.index)
+            for name in removed:
+                key = self.files.pop(name)
+                if index.get(key) == os.path.join(self.directory, name):
+                    del index[key]
+                    # 由规范化后重名的其他片段顶替
+                    for other in sorted(self.files):
+                        if self.files[other] == key and other not in removed:
+                            index[key] = os.path.join(self.directory, other)
+                            break
+            for name in sorted(added):
+                key = self.normalize(os.path.splitext(name)[0])
+                self.files[name] = key
+                if key in index:
+                    print(f"WARN: 本地片段 {name} 与 {os.path.basename(index[key])} 规范化后重名，已忽略")
+                    continue
+                index[key] = os.path.join(self.directory, name)
+            # 整体替换，查询线程不需要加锁
+            self.index = index
+        print(f"本地片段索引已更新: 新增 {len(added)} 个, 移除 {len(removed)} 个, 共 {len(self.index)} 个")
+        return True
+
+    def start(self):
+        """启动后台轮询线程"""
+        if self.poll_thread is not None and self.poll_thread.is_alive():
+            return
+        self.stop_event.clear()
+
+        def poll():
+            while not self.stop_event.wait(self.poll_interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"更新本地片段索引时出错: {e}")
+
+        self.poll_thread = threading.Thread(target=poll, daemon=True)
+        self.poll_thread.start()
+
+    def stop(self):
+        """停止后台轮询线程"""
+        self.stop_event.set()
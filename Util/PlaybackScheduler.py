@@ -0,0 +1,131 @@
+"""
+播放调度器
+所有播放请求进入同一个有序队列，按优先级通道依次播放，支持打断当前播放和丢弃过期请求
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable
+
+# 优先级通道，数值越小越先播放
+PRIORITY_INTERRUPT = -1  # 打断当前播放，立即播放
+PRIORITY_CLIP = 0        # 本地片段、缓存命中等可以立即播放的音频
+PRIORITY_SYNTH = 1       # 需要合成的语音
+
+
+class PlaybackJob:
+    """一个等待播放的任务"""
+
+    def __init__(self, play: Callable[[], None], priority: int, label: str = ''):
+        self.play = play
+        self.priority = priority
+        self.label = label
+        self.enqueued_at = time.monotonic()
+        self.executed = False
+        self.done_event = threading.Event()
+
+    def finish(self, executed: bool):
+        self.executed = executed
+        self.done_event.set()
+
+    def wait(self, timeout=None) -> bool:
+        """等待任务结束，返回任务是否被执行（被丢弃时返回 False）"""
+        self.done_event.wait(timeout)
+        return self.executed
+
+
+class PlaybackScheduler:
+    """单一播放线程 + 优先级队列，替代多个线程争抢播放锁"""
+
+    def __init__(self, player, max_queue: int = 4, max_wait: float = 10.0):
+        """
+        初始化调度器
+
+        Args:
+            player: AudioPlayer 实例，用于打断当前播放
+            max_queue: 队列最大长度，超出时丢弃最低优先级通道中最早的任务
+            max_wait: 任务排队超过该时间（秒）后视为过期，不再播放
+        """
+        self.player = player
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.queue = []
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+        self.current = None
+        self.running = True
+        self.worker = threading.Thread(target=self._run, name='playback-scheduler', daemon=True)
+        self.worker.start()
+
+    def submit(self, play: Callable[[], None], priority: int = PRIORITY_SYNTH,
+               interrupt: bool = False, label: str = '') -> PlaybackJob:
+        """
+        提交播放任务
+
+        Args:
+            play: 执行播放的函数，在调度线程中调用
+            priority: 优先级通道
+            interrupt: 为 True 时打断当前播放并排到队首
+            label: 日志中显示的描述
+        """
+        job = PlaybackJob(play, PRIORITY_INTERRUPT if interrupt else priority, label)
+        with self.cond:
+            if interrupt and self.current is not None:
+                print(f'打断当前播放: {self.current.label[:20]}')
+                self.player.interrupt()
+            heapq.heappush(self.queue, (job.priority, next(self.sequence), job))
+            while len(self.queue) > self.max_queue:
+                self._drop_stale_locked()
+            self.cond.notify()
+        return job
+
+    def stop_all(self):
+        """打断当前播放并清空队列"""
+        with self.cond:
+            for _, _, job in self.queue:
+                job.finish(False)
+            self.queue.clear()
+            if self.current is not None:
+                self.player.interrupt()
+
+    def close(self):
+        """停止调度线程"""
+        self.stop_all()
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _drop_stale_locked(self):
+        # 丢弃最低优先级通道中最早的任务
+        entry = max(self.queue, key=lambda e: (e[0], -e[1]))
+        self.queue.remove(entry)
+        heapq.heapify(self.queue)
+        job = entry[2]
+        print(f'播放队列已满，丢弃: {job.label[:20]}')
+        job.finish(False)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                _, _, job = heapq.heappop(self.queue)
+                if time.monotonic() - job.enqueued_at > self.max_wait:
+                    print(f'播放请求已过期，丢弃: {job.label[:20]}')
+                    job.finish(False)
+                    continue
+                self.current = job
+                # 在锁内复位，保证之后的打断请求一定作用于这个任务
+                self.player.reset_interrupt()
+            try:
+                job.play()
+            except Exception as e:
+                print(f'播放任务出错: {e}')
+            finally:
+                with self.cond:
+                    self.current = None
+                job.finish(True)
@@ -0,0 +1,167 @@
+"""
+pyttsx3 合成线程
+整个进程只初始化一次 pyttsx3 引擎，由一个常驻线程持有并依次处理合成任务，
+不再每条消息都重新查找驱动、启动 SAPI5/espeak。
+"""
+
+import concurrent.futures
+import os
+import queue
+import threading
+
+import pyttsx3
+
+
+class Pyttsx3Worker:
+    """持有一个已初始化引擎的合成线程，引擎只在创建它的线程中使用"""
+
+    # 依次尝试的驱动，None 为当前平台的默认驱动
+    DRIVERS = ('sapi5', None, 'nsss', 'dummy')
+
+    def __init__(self, rate=None, voice=None):
+        """
+        初始化合成线程
+
+        Args:
+            rate: 语速（每分钟词数），为空时使用系统默认
+            voice: 音色 id 或名称的一部分，为空时使用系统默认
+        """
+        self.rate = rate
+        self.voice = voice
+        self.engine = None
+        # 初始化成功的驱动，引擎需要重建时直接使用
+        self.driver = None
+        self.driver_found = False
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # 有任务超时未返回时置为 True，由调用方重建合成线程
+        self.stuck = False
+
+    def start(self):
+        """启动合成线程，引擎在线程中立即初始化"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='pyttsx3-worker', daemon=True)
+                self.thread.start()
+
+    def synthesize(self, text, filepath, timeout=None):
+        """
+        合成到 filepath，等待完成后返回文件绝对路径
+
+        Raises:
+            concurrent.futures.TimeoutError: timeout 秒内没有完成，还在排队的任务会被取消
+        """
+        self.start()
+        future = concurrent.futures.Future()
+        self.jobs.put((text, filepath, future))
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                raise
+            # 任务已经开始执行却没有返回，说明引擎卡住了
+            self.stuck = True
+            raise
+
+    def abandon(self):
+        """
+        放弃卡住的线程（无法强制结束），线程恢复后自行退出
+
+        Returns:
+            还在排队的任务，交给新的合成线程处理
+        """
+        pending = []
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                pending.append(job)
+        self.jobs.put(None)
+        return pending
+
+    def requeue(self, jobs):
+        """接手其他线程未处理的任务"""
+        self.start()
+        for job in jobs:
+            self.jobs.put(job)
+
+    def close(self, timeout=5):
+        """处理完已提交的任务后停止线程"""
+        if self.thread is None:
+            return
+        self.jobs.put(None)
+        self.thread.join(timeout)
+
+    def _init_engine(self):
+        drivers = list(self.DRIVERS)
+        if self.driver_found:
+            drivers.remove(self.driver)
+            drivers.insert(0, self.driver)
+        for driver in drivers:
+            try:
+                # 不使用 pyttsx3.init：它按驱动名复用引擎，会拿到被放弃的线程仍持有的旧引擎
+                engine = pyttsx3.Engine(driver)
+            except Exception:
+                continue
+            if driver == 'dummy':
+                print("WARN: No TTS engine found")
+            self.driver = driver
+            self.driver_found = True
+            self._apply_settings(engine)
+            return engine
+        raise RuntimeError("pyttsx3 引擎初始化失败")
+
+    def _apply_settings(self, engine):
+        """语速和音色只在引擎初始化时设置一次"""
+        try:
+            if self.rate:
+                engine.setProperty('rate', int(self.rate))
+            if self.voice:
+                for voice in engine.getProperty('voices') or []:
+                    if voice.id == self.voice or self.voice.lower() in (voice.name or '').lower():
+                        engine.setProperty('voice', voice.id)
+                        break
+                else:
+                    print(f"WARN: 未找到音色 {self.voice}，使用默认音色")
+        except Exception as e:
+            print(f"WARN: 设置 pyttsx3 语速或音色失败: {e}")
+
+    def _synthesize(self, text, filepath):
+        for attempt in range(2):
+            try:
+                if self.engine is None:
+                    self.engine = self._init_engine()
+                self.engine.save_to_file(text, filepath)
+                self.engine.runAndWait()
+                return os.path.abspath(filepath)
+            except Exception as e:
+                # 引擎状态异常时重建一次再试
+                print(f"WARN: pyttsx3 合成失败: {e}")
+                self.engine = None
+                if attempt:
+                    raise
+
+    def _run(self):
+        try:
+            self.engine = self._init_engine()
+        except Exception as e:
+            print(f"WARN: {e}")
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            text, filepath, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._synthesize(text, filepath))
+            except Exception as e:
+                future.set_exception(e)
+        if self.engine is not None:
+            try:
+                self.engine.stop()
+            except Exception:
+                pass
@@ -0,0 +1,126 @@
+"""
+音频输出后端
+AudioPlayer 通过后端查询设备并打开输出流。默认使用 sounddevice，
+NullBackend 不访问声卡，按设备时序调用回调并记录输出，用于无声卡环境下的测试和性能分析。
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class SoundDeviceBackend:
+    """ 通过 sounddevice(PortAudio) 输出到真实设备 """
+
+    def __init__(self):
+        # 延迟导入, 没有 PortAudio 的环境仍然可以使用其他后端
+        import sounddevice
+        self.sd = sounddevice
+
+    def query_devices(self, device=None):
+        """ 与 sounddevice.query_devices 相同: 不指定设备时返回设备列表, 否则返回该设备的信息 """
+        if device is None:
+            return self.sd.query_devices()
+        return self.sd.query_devices(device)
+
+    def output_stream(self, samplerate, channels, device, callback):
+        """ 创建 int16 回调式输出流, 返回的对象需支持 start/stop/close 和 active 属性 """
+        return self.sd.OutputStream(samplerate=samplerate, channels=channels,
+                                    dtype='int16', device=device,
+                                    latency='low', callback=callback)
+
+
+class NullOutputStream:
+    """ 模拟的输出流: 后台线程每隔 blocksize 帧对应的时长调用一次回调 """
+
+    def __init__(self, backend, samplerate, channels, device, callback, blocksize):
+        self.backend = backend
+        self.samplerate = samplerate
+        self.channels = channels
+        self.device = device
+        self.callback = callback
+        self.blocksize = blocksize
+        self.active = False
+        self.thread = None
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self.thread = threading.Thread(target=self._run, name=f'null-output-{self.device}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, self.channels), dtype=np.int16)
+        period = self.blocksize / self.samplerate * self.backend.time_scale
+        next_time = time.perf_counter()
+        while self.active:
+            self.callback(outdata, self.blocksize, None, None)
+            self.backend.record(self.device, outdata)
+            # 按设备时钟推进, 不因回调耗时而累积误差
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.perf_counter()
+                time.sleep(0)
+
+    def stop(self):
+        self.active = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+
+
+class NullBackend:
+    """ 不输出声音的后端, 统计各设备输出的帧数, record=True 时保存输出的每个缓冲区 """
+
+    def __init__(self, samplerate=48000, channels=2, devices=None, blocksize=512,
+                 time_scale=1.0, record=False):
+        """
+        Args:
+            samplerate, channels: 默认设备的原生格式
+            devices: 设备信息列表 (字段同 sounddevice), 不指定时只有一个默认设备
+            blocksize: 每次回调的帧数
+            time_scale: 模拟时钟的倍率, 1.0 为实时, 0 为不等待
+            record: 是否保存输出的缓冲区
+        """
+        self.devices = devices or [{'name': 'Null Output', 'index': 0,
+                                    'default_samplerate': float(samplerate),
+                                    'max_output_channels': channels}]
+        self.blocksize = blocksize
+        self.time_scale = time_scale
+        self.recording = record
+        self.buffers = {}
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def query_devices(self, device=None):
+        if device is None:
+            return list(self.devices)
+        for info in self.devices:
+            if info['index'] == device or info['name'] == device:
+                return info
+        raise ValueError(f"设备不存在: {device}")
+
+    def output_stream(self, samplerate, channels, device, callback):
+        return NullOutputStream(self, samplerate, channels, device, callback, self.blocksize)
+
+    def record(self, device, outdata):
+        """ 由模拟输出流在每次回调后调用 """
+        with self.lock:
+            self.frames[device] = self.frames.get(device, 0) + len(outdata)
+            if self.recording:
+                self.buffers.setdefault(device, []).append(outdata.copy())
+
+    def recorded(self, device):
+        """ 设备输出过的全部数据 (帧数, 声道数), 需要 record=True """
+        with self.lock:
+            buffers = list(self.buffers.get(device, []))
+        if not buffers:
+            return np.zeros((0, 1), dtype=np.int16)
+        return np.concatenate(buffers)
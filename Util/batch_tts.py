@@ -0,0 +1,183 @@
+"""
+批量合成
+把文本文件中的每一行预先合成到缓存中，之后按热键播放时直接命中缓存
+
+用法:
+    python -m Util.batch_tts lines.txt [--engine fish_audio_tts] [--workers 4] [--retries 2]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+import wave
+from typing import Callable, Iterable, List, Optional
+
+from Util.loadSetting import getConfigDict
+from Util.tts import get_cache_key, get_tts_cache, pyttsx3_tts, tts_if_not_exists
+
+
+def read_lines(path) -> List[str]:
+    """读取文本文件，忽略空行和以 ; 开头的注释行，去除重复行"""
+    lines = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(';') or line in seen:
+                continue
+            seen.add(line)
+            lines.append(line)
+    return lines
+
+
+def wav_duration(path) -> float:
+    try:
+        with wave.open(path, 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except Exception:
+        return 0.0
+
+
+def synthesize_one(text, directory, tts_engine, cache, pyttsx3_pool=None) -> bool:
+    """合成一条文本到缓存，返回结果是否已登记在缓存中"""
+    if pyttsx3_pool is None:
+        # 回退引擎的结果不会登记在缓存中，失败时不回退，只重试原引擎
+        tts_if_not_exists(text, directory, tts_engine, fallback=False)
+    else:
+        # pyttsx3 引擎不能跨线程使用，在子进程中合成，缓存索引只由本进程维护
+        key = get_cache_key(text, tts_engine)
+        path = cache.path_for(key)
+        pyttsx3_pool.submit(pyttsx3_tts, text, path).result()
+        cache.put(key, path)
+    return cache.get(get_cache_key(text, tts_engine)) is not None
+
+
+def synthesize_batch(lines: Iterable[str], directory='./temp', tts_engine: Optional[str] = None,
+                     workers=4, retries=2, progress: Optional[Callable[[str], None]] = print) -> dict:
+    """
+    批量合成到缓存
+
+    Fish Audio 与 api_tts 在线程中并发合成（每个线程一个 Fish Audio 会话），
+    pyttsx3 在子进程中并发合成。已在缓存中的文本直接跳过，失败的文本最多重试 retries 次。
+
+    Args:
+        lines: 要合成的文本
+        directory: 缓存目录
+        tts_engine: 合成引擎，默认使用配置中的 TTS_ENGINE
+        workers: 并发数量
+        retries: 每条文本失败后的重试次数
+        progress: 进度输出函数，为 None 时不输出
+
+    Returns:
+        统计信息字典: total, cached, synthesized, failed(失败的文本列表), seconds, audio_seconds
+    """
+    if tts_engine is None:
+        tts_engine = getConfigDict().get('TTS_ENGINE', 'pyttsx3_tts')
+    cache = get_tts_cache(directory)
+    if not cache.enabled:
+        raise ValueError("缓存已关闭（TTS_CACHE_MAX_MB=0），批量合成的结果无法保存")
+    os.makedirs(directory, exist_ok=True)
+
+    lines = list(lines)
+    stats = {'total': len(lines), 'cached': 0, 'synthesized': 0, 'failed': [],
+             'seconds': 0.0, 'audio_seconds': 0.0}
+    lock = threading.Lock()
+    done = [0]
+    start_time = time.time()
+
+    def report(text, status):
+        with lock:
+            done[0] += 1
+            if progress is not None:
+                progress(f"[{done[0]}/{stats['total']}] {status} {text[:30]}")
+
+    pending = []
+    for text in lines:
+        path = cache.get(get_cache_key(text, tts_engine))
+        if path:
+            stats['cached'] += 1
+            report(text, '已缓存')
+        else:
+            pending.append(text)
+
+    pyttsx3_pool = None
+    if tts_engine == 'pyttsx3_tts':
+        pyttsx3_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    elif tts_engine == 'fish_audio_tts':
+        # 在本进程中启动 Fish Audio 服务，每个并发线程使用连接池中的一条连接
+        from Util.fish_audio_server import fish_service
+        fish_service.pool.size = max(fish_service.pool.size, workers)
+        fish_service.start()
+
+    def run(text):
+        for attempt in range(retries + 1):
+            try:
+                if synthesize_one(text, directory, tts_engine, cache, pyttsx3_pool):
+                    path = cache.get(get_cache_key(text, tts_engine))
+                    with lock:
+                        stats['synthesized'] += 1
+                        stats['audio_seconds'] += wav_duration(path)
+                    report(text, '完成' if attempt == 0 else f'完成(重试{attempt}次)')
+                    return
+            except Exception as e:
+                if progress is not None:
+                    progress(f"合成出错: {text[:30]}: {e}")
+            if attempt < retries:
+                time.sleep(min(2 ** attempt, 10))
+        with lock:
+            stats['failed'].append(text)
+        report(text, '失败')
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, pending))
+    finally:
+        if pyttsx3_pool is not None:
+            pyttsx3_pool.shutdown()
+        cache.flush()
+
+    stats['seconds'] = time.time() - start_time
+    return stats
+
+
+def format_summary(stats) -> str:
+    """吞吐量统计"""
+    seconds = max(stats['seconds'], 1e-6)
+    lines = [
+        f"共 {stats['total']} 条: 合成 {stats['synthesized']} 条, 已缓存 {stats['cached']} 条, "
+        f"失败 {len(stats['failed'])} 条",
+        f"耗时 {stats['seconds']:.1f} 秒, {stats['synthesized'] / seconds:.2f} 条/秒, "
+        f"合成音频 {stats['audio_seconds']:.1f} 秒 (实时倍率 {stats['audio_seconds'] / seconds:.1f}x)",
+    ]
+    for text in stats['failed']:
+        lines.append(f"失败: {text}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把文本文件中的每一行批量合成到缓存')
+    parser.add_argument('file', help='文本文件，每行一条')
+    parser.add_argument('--engine', default=None, help='合成引擎，默认使用配置中的 TTS_ENGINE')
+    parser.add_argument('--directory', default='./temp', help='缓存目录')
+    parser.add_argument('--workers', type=int, default=None, help='并发数量，默认使用配置中的 BATCH_WORKERS')
+    parser.add_argument('--retries', type=int, default=2, help='失败后的重试次数')
+    args = parser.parse_args(argv)
+
+    config = getConfigDict()
+    engine = args.engine or config.get('TTS_ENGINE', 'pyttsx3_tts')
+    workers = args.workers or int(config.get('BATCH_WORKERS', '4'))
+    try:
+        stats = synthesize_batch(read_lines(args.file), args.directory, engine, workers, args.retries)
+    finally:
+        if engine == 'fish_audio_tts':
+            from Util.fish_audio_server import fish_service
+            fish_service.close()
+    print(format_summary(stats))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
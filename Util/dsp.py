@@ -0,0 +1,214 @@
+"""
+音频处理工具
+float32 增益 + 软限幅（超出满幅前平滑压缩，不再整数回绕），以及 EBU R128 / ITU-R BS.1770 响度测量
+"""
+
+import threading
+import numpy as np
+
+# BS.1770 K 计权滤波器参数（与采样率无关的模拟原型，按实际采样率离散化）
+SHELF_GAIN_DB = 4.0
+SHELF_Q = 1 / np.sqrt(2)
+SHELF_FC = 1500.0
+HIGHPASS_Q = 0.5
+HIGHPASS_FC = 38.0
+
+# 门限
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU
+
+# 每次做 FFT 的子块数量，限制长音频测量时的内存占用
+BATCH_BLOCKS = 256
+
+
+def _biquad_power_response(b, a, freqs, samplerate):
+    """二阶滤波器在给定频率处的功率响应 |H|^2"""
+    z = np.exp(-1j * 2 * np.pi * freqs / samplerate)
+    numerator = b[0] + b[1] * z + b[2] * z * z
+    denominator = a[0] + a[1] * z + a[2] * z * z
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting_power(freqs, samplerate):
+    """K 计权（高架 + 高通）在给定频率处的功率响应"""
+    A = 10 ** (SHELF_GAIN_DB / 40)
+    w0 = 2 * np.pi * SHELF_FC / samplerate
+    alpha = np.sin(w0) / (2 * SHELF_Q)
+    cos_w0 = np.cos(w0)
+    shelf_b = (A * ((A + 1) + (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha),
+               -2 * A * ((A - 1) + (A + 1) * cos_w0),
+               A * ((A + 1) + (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha))
+    shelf_a = ((A + 1) - (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha,
+               2 * ((A - 1) - (A + 1) * cos_w0),
+               (A + 1) - (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha)
+
+    w0 = 2 * np.pi * HIGHPASS_FC / samplerate
+    alpha = np.sin(w0) / (2 * HIGHPASS_Q)
+    cos_w0 = np.cos(w0)
+    highpass_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    highpass_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    return (_biquad_power_response(shelf_b, shelf_a, freqs, samplerate)
+            * _biquad_power_response(highpass_b, highpass_a, freqs, samplerate))
+
+
+def measure_loudness(samples, samplerate, channels=1):
+    """
+    测量积分响度（LUFS）
+
+    以 100ms 子块在频域施加 K 计权并求能量，每 4 个子块组成一个 400ms、75% 重叠的测量块，
+    再按绝对门限 -70 LUFS 和相对门限 -10 LU 做门控。静音返回 -inf。
+
+    Args:
+        samples: int16 数组，多声道为交错排列
+        samplerate: 采样率
+        channels: 声道数
+    """
+    audio = np.asarray(samples).reshape(-1, channels)
+    sub_len = max(int(samplerate * 0.1), 1)
+    n_sub = len(audio) // sub_len
+    if n_sub < 4:
+        # 不足 400ms 时整段作为一个测量块
+        sub_len = max(len(audio), 1)
+        n_sub = 1 if len(audio) else 0
+    if n_sub == 0:
+        return float('-inf')
+
+    freqs = np.fft.rfftfreq(sub_len, 1 / samplerate)
+    weight = k_weighting_power(freqs, samplerate).astype(np.float32)
+    # rfft 的单边谱除直流和奈奎斯特外需要计两次
+    weight[1:(sub_len + 1) // 2] *= 2
+
+    # 每个子块的 K 计权能量（各声道权重均为 1.0，环绕声道不在本程序的使用范围内）
+    sub_energy = np.zeros(n_sub, dtype=np.float64)
+    scale = 1.0 / (32768.0 * 32768.0 * sub_len * sub_len)
+    for channel in range(audio.shape[1]):
+        for start in range(0, n_sub, BATCH_BLOCKS):
+            stop = min(start + BATCH_BLOCKS, n_sub)
+            frames = audio[start * sub_len:stop * sub_len, channel].astype(np.float32).reshape(-1, sub_len)
+            spectrum = np.fft.rfft(frames, axis=1)
+            power = spectrum.real ** 2 + spectrum.imag ** 2
+            sub_energy[start:stop] += (power @ weight) * scale
+
+    # 400ms 测量块，步长 100ms
+    if n_sub >= 4:
+        block_energy = np.convolve(sub_energy, np.full(4, 0.25), mode='valid')
+    else:
+        block_energy = sub_energy
+
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_energy)
+    gated = block_energy[block_loudness > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return float('-inf')
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = block_energy[block_loudness > max(relative_gate, ABSOLUTE_GATE)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def normalization_gain(loudness, target, max_gain_db=12.0):
+    """把响度调整到目标值所需的线性增益，提升量不超过 max_gain_db"""
+    if loudness is None or target is None or not np.isfinite(loudness):
+        return 1.0
+    gain_db = min(target - loudness, max_gain_db)
+    return 10 ** (gain_db / 20)
+
+
+def soft_limit(work, threshold):
+    """原地软限幅：超过阈值的部分用 tanh 平滑压缩，输出绝对值不超过 1.0"""
+    over = np.abs(work) > threshold
+    if not over.any():
+        return work
+    peaks = work[over]
+    headroom = 1.0 - threshold
+    work[over] = np.sign(peaks) * (threshold + headroom * np.tanh((np.abs(peaks) - threshold) / headroom))
+    return work
+
+
+class GainStage:
+    """float32 增益 + 软限幅，使用预分配的工作缓冲区分块处理"""
+
+    def __init__(self, block_size=65536, threshold=0.891):
+        """
+        Args:
+            block_size: 每次处理的采样点数
+            threshold: 软限幅起点（满幅为 1.0，默认约 -1 dBFS）
+        """
+        self.block_size = block_size
+        self.threshold = threshold
+        self.work = np.empty(block_size, dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def process(self, samples, gain, out=None):
+        """
+        对 int16 采样施加增益，结果写入 out（未提供时新建）
+
+        增益为 1.0 时 int16 不可能越界，直接返回原数组，不做任何复制。
+        """
+        if gain == 1.0 and out is None:
+            return samples
+        if out is None:
+            out = np.empty(len(samples), dtype=np.int16)
+        scale = np.float32(gain / 32768.0)
+        with self.lock:
+            for start in range(0, len(samples), self.block_size):
+                block = samples[start:start + self.block_size]
+                work = self.work[:len(block)]
+                np.multiply(block, scale, out=work)
+                soft_limit(work, self.threshold)
+                np.multiply(work, np.float32(32767.0), out=work)
+                np.rint(work, out=work)
+                out[start:start + len(block)] = work
+        return out
+
+
+class Resampler:
+    """有状态的线性插值重采样器，按块处理时块与块之间保持连续"""
+
+    def __init__(self, src_rate, dst_rate, channels):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate
+        # 下一个输出样本在输入中的位置，0 对应上一块的最后一帧
+        self.position = 1.0
+        self.last = np.zeros((1, channels), dtype=np.float32)
+
+    def process(self, audio):
+        """重采样 (帧数, 声道数) 的 int16 数据"""
+        if self.src_rate == self.dst_rate:
+            return audio
+        src = np.concatenate([self.last, audio.astype(np.float32)])
+        end = len(src) - 1
+        if self.position > end:
+            count = 0
+        else:
+            count = int((end - self.position) // self.step) + 1
+        positions = self.position + np.arange(count) * self.step
+        index = positions.astype(np.int64)
+        frac = (positions - index).astype(np.float32)[:, None]
+        upper = np.minimum(index + 1, end)
+        out = src[index] * (1 - frac) + src[upper] * frac
+        self.position = self.position + count * self.step - end
+        self.last = src[-1:]
+        np.rint(out, out=out)
+        return out.astype(np.int16)
+
+
+def resample(audio, src_rate, dst_rate):
+    """整段重采样 (帧数, 声道数) 的 int16 数据"""
+    return Resampler(src_rate, dst_rate, audio.shape[1]).process(audio)
+
+
+def convert_channels(audio, channels):
+    """(帧数, 声道数) 的 int16 数据转换为指定声道数：单声道复制到各声道，多声道下混为单声道"""
+    if audio.shape[1] == channels:
+        return audio
+    if audio.shape[1] == 1:
+        return np.repeat(audio, channels, axis=1)
+    if channels == 1:
+        return audio.mean(axis=1, keepdims=True).astype(np.int16)
+    if audio.shape[1] > channels:
+        return np.ascontiguousarray(audio[:, :channels])
+    # 声道不足时重复最后一个声道
+    extra = np.repeat(audio[:, -1:], channels - audio.shape[1], axis=1)
+    return np.concatenate([audio, extra], axis=1)
@@ -4,20 +4,26 @@ Fish Audio 本地 API 服务器
 """
 
 import asyncio
+import base64
+import concurrent.futures
+import functools
 import os
 import hashlib
+import queue
 import time
 import threading
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from werkzeug.serving import make_server
 import tempfile
 import logging
 import websockets
-from typing import Optional, Dict, Any, List
+from websockets.protocol import State
+from typing import Optional, Dict, Any, List, Callable, Tuple
 import ormsgpack as msgpack
 
-from Util.audio_converter import convert_opus_to_wav_simple
+from Util import latency_trace, metrics
 from Util.loadSetting import getConfigDict
+from Util.single_flight import SingleFlight, StreamFlight
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -25,14 +31,55 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Fish Audio 可以直接返回的格式；pcm 为 16-bit 小端单声道裸数据
+SUPPORTED_FORMATS = ('wav', 'pcm', 'mp3', 'opus')
+# Fish Audio 实时合成的 WebSocket 地址，基准测试时指向本地模拟服务
+FISH_WS_URL = "wss://api.fish.audio/v1/tts/live"
+
+class IncompleteAudioError(Exception):
+    """会话没有收到 finish 就结束（连接提前关闭或接收超时），收到的音频不完整"""
+
+
+class AudioBuffer:
+    """预分配的音频接收缓冲区
+
+    音频块直接写入 bytearray 的空闲部分，容量不足时按倍数扩容，
+    完成后以 memoryview 交给调用方，整个过程只有写入这一次复制。
+    """
+    
+    def __init__(self, capacity: int = 256 * 1024):
+        self.data = bytearray(capacity)
+        self.size = 0
+    
+    def __len__(self):
+        return self.size
+    
+    def append(self, chunk: bytes):
+        end = self.size + len(chunk)
+        if end > len(self.data):
+            grown = bytearray(max(end, len(self.data) * 2))
+            grown[:self.size] = memoryview(self.data)[:self.size]
+            self.data = grown
+        memoryview(self.data)[self.size:end] = chunk
+        self.size = end
+    
+    def view(self) -> memoryview:
+        """已写入数据的只读视图"""
+        return memoryview(self.data)[:self.size].toreadonly()
+
+
 class FishAudioWebSocketAPI:
     """Fish Audio WebSocket API 测试客户端"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, ping_interval: float = 30, ping_timeout: float = 10,
+                 url: str = FISH_WS_URL):
         self.api_key = api_key
         self.websocket = None
-        self.url = "wss://api.fish.audio/v1/tts/live"
+        self.url = url
         self.connected = False
+        self.model = None
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
         
     async def connect(self, model: str = "speech-1.5"):
         """连接到 WebSocket API"""
@@ -44,20 +91,29 @@ class FishAudioWebSocketAPI:
             "Authorization": f"Bearer {self.api_key}"
         }
         
+        start = time.perf_counter()
         try:
             self.websocket = await websockets.connect(
                 url_with_params,
                 additional_headers=headers,
-                ping_interval=30,
-                ping_timeout=10
+                ping_interval=self.ping_interval,
+                ping_timeout=self.ping_timeout
             )
             self.connected = True
+            self.model = model
+            metrics.fish_connect_seconds.observe(time.perf_counter() - start)
             print(f"✅ 成功连接到 Fish Audio API (模型: {model})")
             return True
         except Exception as e:
+            metrics.fish_connect_failures.inc()
             print(f"❌ 连接失败: {e}")
             return False
     
+    def is_alive(self) -> bool:
+        """连接是否仍然可用（心跳超时或服务端关闭后会变为不可用）"""
+        return bool(self.connected and self.websocket
+                    and self.websocket.state == State.OPEN)
+    
     async def disconnect(self):
         """断开 WebSocket 连接"""
         if self.websocket and self.connected:
@@ -102,7 +158,8 @@ class FishAudioWebSocketAPI:
         top_p: float = 0.7,
         speed: float = 1.0,
         volume: int = 0,
-        references: Optional[List[Dict]] = None
+        references: Optional[List[Dict]] = None,
+        sample_rate: Optional[int] = None
     ):
         """启动 TTS 会话"""
         start_message = {
@@ -120,6 +177,8 @@ class FishAudioWebSocketAPI:
                 "reference_id": reference_id
             }
         }
+        if sample_rate:
+            start_message["request"]["sample_rate"] = sample_rate
         
         # 如果提供了参考音频，添加到请求中
         if references:
@@ -148,6 +207,207 @@ class FishAudioWebSocketAPI:
         await self.send_message(stop_message)
 
 
+class FishAudioConnectionPool:
+    """Fish Audio WebSocket 连接池
+
+    按模型保持若干条已完成握手和认证的空闲连接，合成请求直接取用，
+    不再在热路径上进行 TLS/WebSocket 握手。连接依靠 ping_interval 心跳保活，
+    断开的连接会被丢弃并在后台重新建立。
+    """
+    
+    def __init__(self, api_key: str, size: int = 2, ping_interval: float = 30, ping_timeout: float = 10,
+                 url: str = FISH_WS_URL):
+        self.api_key = api_key
+        self.url = url
+        self.size = size
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle: Dict[str, List[FishAudioWebSocketAPI]] = {}
+        # 各模型被取出、尚未归还的连接数
+        self.in_use: Dict[str, int] = {}
+        self.refill_tasks: Dict[str, asyncio.Task] = {}
+        self.health_task: Optional[asyncio.Task] = None
+        self.closed = False
+    
+    def _new_client(self) -> FishAudioWebSocketAPI:
+        return FishAudioWebSocketAPI(self.api_key, self.ping_interval, self.ping_timeout, self.url)
+    
+    async def acquire(self, model: str) -> FishAudioWebSocketAPI:
+        """取出一条可用连接，没有空闲连接时才现场建立"""
+        self._ensure_health_check()
+        idle = self.idle.setdefault(model, [])
+        client = None
+        discarded = False
+        while idle:
+            candidate = idle.pop()
+            if candidate.is_alive():
+                client = candidate
+                break
+            discarded = True
+            await candidate.disconnect()
+        
+        # 取出的连接仍计入 size，会话结束后归还；只有丢弃了断开的连接或池已取空时才补充
+        self.in_use[model] = self.in_use.get(model, 0) + 1
+        if discarded or client is None:
+            self._schedule_refill(model)
+        
+        if client is None:
+            logger.info(f"连接池无可用连接，直接建立新连接 (模型: {model})")
+            client = self._new_client()
+            try:
+                connected = await client.connect(model=model)
+            except BaseException:
+                self.in_use[model] -= 1
+                raise
+            if not connected:
+                self.in_use[model] -= 1
+                raise Exception("无法连接到 Fish Audio API")
+        return client
+    
+    async def release(self, client: FishAudioWebSocketAPI, reusable: bool = True):
+        """归还连接；会话未正常结束或连接已断开时关闭并补充，超出 size 的连接直接关闭"""
+        model = client.model
+        idle = self.idle.setdefault(model, [])
+        self.in_use[model] = max(self.in_use.get(model, 0) - 1, 0)
+        healthy = reusable and not self.closed and client.is_alive()
+        if healthy and self._count(model) < self.size:
+            idle.append(client)
+            return
+        await client.disconnect()
+        if not healthy:
+            self._schedule_refill(model)
+    
+    def _count(self, model: str) -> int:
+        """该模型的空闲连接与取出未归还的连接总数"""
+        return len(self.idle.get(model, [])) + self.in_use.get(model, 0)
+    
+    async def warm(self, model: str):
+        """预先建立连接，补满到 size 条"""
+        self._ensure_health_check()
+        await self._refill(model)
+    
+    def _schedule_refill(self, model: str):
+        if self.closed:
+            return
+        task = self.refill_tasks.get(model)
+        if task is None or task.done():
+            self.refill_tasks[model] = asyncio.get_running_loop().create_task(self._refill(model))
+    
+    async def _refill(self, model: str):
+        idle = self.idle.setdefault(model, [])
+        while not self.closed and self._count(model) < self.size:
+            client = self._new_client()
+            if not await client.connect(model=model):
+                # 连接失败时稍后由健康检查重试，避免在网络异常时频繁重连
+                return
+            idle.append(client)
+    
+    def _ensure_health_check(self):
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.get_running_loop().create_task(self._health_check())
+    
+    async def _health_check(self):
+        """按 ping_interval 周期检查空闲连接，移除断开的连接并重新补充"""
+        while not self.closed:
+            await asyncio.sleep(self.ping_interval)
+            for model, idle in list(self.idle.items()):
+                alive = [client for client in idle if client.is_alive()]
+                if len(alive) != len(idle):
+                    logger.info(f"连接池移除 {len(idle) - len(alive)} 条已断开的连接 (模型: {model})")
+                    idle[:] = alive
+                self._schedule_refill(model)
+    
+    async def close(self):
+        """关闭所有连接"""
+        self.closed = True
+        if self.health_task:
+            self.health_task.cancel()
+        for task in self.refill_tasks.values():
+            task.cancel()
+        for idle in self.idle.values():
+            for client in idle:
+                await client.disconnect()
+            idle.clear()
+
+
+class AsyncRuntime:
+    """长期运行的 asyncio 事件循环线程
+
+    同步调用方（Flask 线程、热键线程）通过 run_coroutine_threadsafe 把协程提交到这里，
+    所有请求共享同一个循环的连接池和 I/O 多路复用，也可以统一取消。
+    """
+    
+    def __init__(self, name: str = "fish-audio-runtime"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+    
+    @property
+    def running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+    
+    def start(self):
+        """启动事件循环线程（重复调用无副作用）"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            ready = threading.Event()
+            self.loop = asyncio.new_event_loop()
+            
+            def run_loop():
+                asyncio.set_event_loop(self.loop)
+                self.loop.call_soon(ready.set)
+                self.loop.run_forever()
+            
+            self.thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            self.thread.start()
+            ready.wait()
+            logger.info(f"事件循环线程已启动: {self.name}")
+    
+    def submit(self, coro) -> concurrent.futures.Future:
+        """提交协程，立即返回 concurrent.futures.Future"""
+        if not self.running:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(latency_trace.bind_coroutine(coro), self.loop)
+    
+    def run(self, coro, timeout: Optional[float] = None):
+        """提交协程并等待结果，超时后取消对应的任务"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+    
+    def stop(self, timeout: float = 5):
+        """取消所有未完成的任务并停止事件循环"""
+        with self.lock:
+            if self.loop is None:
+                return
+            loop = self.loop
+            
+            async def shutdown():
+                tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            
+            if loop.is_running():
+                try:
+                    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=timeout)
+                except Exception as e:
+                    logger.warning(f"取消事件循环任务失败: {e}")
+                loop.call_soon_threadsafe(loop.stop)
+            if self.thread is not None:
+                self.thread.join(timeout=timeout)
+            if not loop.is_running():
+                loop.close()
+            self.loop = None
+            self.thread = None
+            logger.info(f"事件循环线程已停止: {self.name}")
+
+
 class FishAudioService:
     """Fish Audio TTS 服务类"""
     
@@ -168,123 +428,223 @@ class FishAudioService:
             'temperature': float(config.get('FISH_TEMPERATURE', '0.7')),
             'top_p': float(config.get('FISH_TOP_P', '0.7')),
             'speed': float(config.get('FISH_SPEED', '1.0')),
-            'volume': int(config.get('FISH_VOLUME', '0'))
+            'volume': int(config.get('FISH_VOLUME', '0')),
+            'sample_rate': int(config.get('FISH_SAMPLE_RATE', '44100'))
         }
         
-    async def generate_tts_async(self, text: str, output_path: str, language: str = "ZH"):
-        """异步生成 TTS 音频"""
+        # 单次请求的最长等待时间（秒）
+        self.request_timeout = float(config.get('FISH_REQUEST_TIMEOUT', '60'))
+        
+        # 服务独占的事件循环线程，连接池中的连接都绑定在这个循环上
+        self.runtime = AsyncRuntime()
+        # WebSocket 连接池
+        self.pool = FishAudioConnectionPool(
+            self.api_key,
+            size=int(config.get('FISH_POOL_SIZE', '2'))
+        )
+    
+    def start(self):
+        """启动事件循环线程并在后台预先建立连接，不阻塞调用方"""
+        self.runtime.start()
+        self.runtime.submit(self.pool.warm(self.tts_settings.get('model', 'speech-1.5')))
+    
+    def close(self):
+        """关闭连接池并停止事件循环线程"""
+        if not self.runtime.running:
+            return
         try:
-            # 创建 Fish Audio API 客户端
-            api_client = FishAudioWebSocketAPI(self.api_key)
+            self.runtime.run(self.pool.close(), timeout=5)
+        except Exception as e:
+            logger.warning(f"关闭连接池失败: {e}")
+        self.runtime.stop()
+        
+    async def iter_audio_chunks(self, text: str, language: str = "ZH", format: Optional[str] = None):
+        """异步逐块产出 Fish Audio 返回的音频数据（原始编码字节）
+
+        format 指定本次会话请求的格式，不指定时使用配置中的 FISH_FORMAT。
+        没有收到 finish 就结束时抛出 IncompleteAudioError，已产出的数据不能当作完整结果使用。
+        """
+        # 根据语言选择合适的设置
+        session_settings = self.tts_settings.copy()
+        if format:
+            session_settings['format'] = format
+        if session_settings.get('format') not in ('pcm', 'wav'):
+            # 压缩格式使用编码器自身的采样率
+            session_settings.pop('sample_rate', None)
+        if 'model' in session_settings:
+            model = session_settings.pop('model')
+        else:
+            model = "speech-1.5"
+        
+        # 从连接池取出已预热的连接
+        api_client = await self.pool.acquire(model)
+        latency_trace.mark('fish_connect')
+        # 只有收到 finish 的连接才能放回池中复用
+        reusable = False
+        first_audio = True
+        metrics.fish_sessions_in_flight.inc()
+        
+        try:
+            # 启动会话
+            await api_client.start_session(
+                reference_id=self.reference_id,
+                **session_settings
+            )
             
-            # 根据语言选择合适的设置
-            session_settings = self.tts_settings.copy()
-            if 'model' in session_settings:
-                model = session_settings.pop('model')
-            else:
-                model = "speech-1.5"
+            # 发送文本
+            await api_client.send_text(text + " ")
             
-            # 连接到 API
-            if not await api_client.connect(model=model):
-                raise Exception("无法连接到 Fish Audio API")
+            # 停止会话
+            await api_client.stop_session()
             
-            try:
-                # 启动会话
-                await api_client.start_session(
-                    reference_id=self.reference_id,
-                    **session_settings
-                )
-                
-                # 发送文本
-                await api_client.send_text(text + " ")
-                
-                # 停止会话
-                await api_client.stop_session()
-                
-                # 接收音频数据
-                audio_chunks = []
-                start_time = time.time()
-                
-                while api_client.connected and (time.time() - start_time) < 30:
-                    message = await api_client.receive_message()
-                    if not message:
-                        break
-                    
-                    event = message.get("event")
-                    if event == "audio":
-                        audio_data = message.get("audio")
-                        if audio_data:
-                            audio_chunks.append(audio_data)
-                    elif event == "finish":
-                        break
+            # 接收音频数据
+            start_time = time.time()
+            sent_at = time.perf_counter()
+            
+            while api_client.connected and (time.time() - start_time) < 30:
+                message = await api_client.receive_message()
+                if not message:
+                    break
                 
-                # 合并音频数据并保存
-                if audio_chunks:
-                    # 写入原始音频数据
-                    temp_output = output_path + ".temp"
-                    with open(temp_output, "wb") as f:
-                        for chunk in audio_chunks:
-                            if isinstance(chunk, str):
-                                import base64
-                                audio_bytes = base64.b64decode(chunk)
-                            else:
-                                audio_bytes = chunk
-                            f.write(audio_bytes)
-                    
-                    # 如果请求的是 WAV 格式，而 Fish Audio 返回的是 opus，需要转换
-                    if output_path.endswith('.wav') and session_settings.get('format', 'opus') == 'wav':
-                        # 尝试使用 ffmpeg 或其他工具转换，这里先简单重命名
-                        try:
-                            import shutil
-                            shutil.move(temp_output, output_path)
-                            
-                            # 验证生成的文件
-                            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                                logger.info(f"TTS 音频已生成: {output_path}")
-                                return True
-                            else:
-                                logger.error("生成的音频文件无效")
-                                return False
-                        except Exception as e:
-                            logger.error(f"音频文件处理失败: {e}")
-                            return False
-                    else:
-                        # 直接移动文件
-                        try:
-                            import shutil
-                            shutil.move(temp_output, output_path)
-                            logger.info(f"TTS 音频已生成: {output_path}")
-                            return True
-                        except Exception as e:
-                            logger.error(f"文件移动失败: {e}")
-                            return False
-                else:
-                    logger.error("未收到音频数据")
-                    return False
-                    
-            finally:
-                await api_client.disconnect()
+                event = message.get("event")
+                if event == "audio":
+                    audio_data = message.get("audio")
+                    if audio_data:
+                        if isinstance(audio_data, str):
+                            audio_data = base64.b64decode(audio_data)
+                        if first_audio:
+                            latency_trace.mark('fish_first_audio')
+                            metrics.fish_first_chunk_seconds.observe(time.perf_counter() - sent_at)
+                            first_audio = False
+                        metrics.fish_bytes_received.inc(len(audio_data))
+                        yield audio_data
+                elif event == "finish":
+                    latency_trace.mark('fish_finish')
+                    reusable = True
+                    break
+            if not reusable:
+                raise IncompleteAudioError("连接提前关闭或接收超时，没有收到 finish")
+        finally:
+            metrics.fish_sessions_in_flight.dec()
+            await self.pool.release(api_client, reusable)
+    
+    async def generate_tts_async(self, text: str, output_path: str, language: str = "ZH",
+                                 format: Optional[str] = None):
+        """异步生成 TTS 音频，接收完成后一次性写入 output_path"""
+        try:
+            audio = await self.collect_audio_async(text, language, format)
+            if not audio:
+                logger.error("未收到音频数据")
+                return False
+            
+            def write():
+                with open(output_path, "wb") as f:
+                    f.write(audio)
+            
+            # 写文件放到线程池中，不阻塞事件循环
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, write)
+            except Exception as e:
+                logger.error(f"音频文件写入失败: {e}")
+                return False
+            logger.info(f"TTS 音频已生成: {output_path}")
+            return True
                 
         except Exception as e:
             logger.error(f"TTS 生成失败: {e}")
             return False
     
-    def generate_tts(self, text: str, output_path: str, language: str = "ZH"):
-        """同步生成 TTS 音频（包装异步方法）"""
-        # 创建新的事件循环（避免与主线程冲突）
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    async def collect_audio_async(self, text: str, language: str = "ZH", format: Optional[str] = None) -> memoryview:
+        """异步合成并返回完整的编码音频数据（内存缓冲区的只读视图）"""
+        buffer = AudioBuffer()
+        async for chunk in self.iter_audio_chunks(text, language, format):
+            buffer.append(chunk)
+        return buffer.view()
+    
+    async def generate_tts_stream_async(self, text: str, on_audio: Callable[[bytes], None], language: str = "ZH",
+                                        format: Optional[str] = None):
+        """异步流式生成 TTS 音频，每收到一块音频数据立即交给 on_audio 回调
+
+        返回是否完整收到了音频；失败或中途中断时返回 False（此前的数据可能已经交给回调）。
+        """
+        received = 0
+        try:
+            async for chunk in self.iter_audio_chunks(text, language, format):
+                on_audio(chunk)
+                received += len(chunk)
+        except Exception as e:
+            logger.error(f"TTS 流式生成失败: {e}")
+            return False
+        if not received:
+            logger.error("未收到音频数据")
+        return received > 0
+    
+    def generate_tts(self, text: str, output_path: str, language: str = "ZH", format: Optional[str] = None):
+        """同步生成 TTS 音频（提交到服务的事件循环线程执行）"""
+        try:
+            return self.runtime.run(self.generate_tts_async(text, output_path, language, format),
+                                    timeout=self.request_timeout)
+        except concurrent.futures.TimeoutError:
+            logger.error(f"TTS 生成超时（{self.request_timeout} 秒），已取消")
+            return False
+
+    def open_audio_stream(self, text: str, language: str = "ZH", format: Optional[str] = None):
+        """开始合成，返回 (逐块产出音频数据的生成器, 取消函数)
+
+        合成在服务的事件循环中进行，生成器在调用方线程中迭代，提前关闭（如客户端断开）时取消合成。
+        取消函数可以在任意线程调用。合成失败、中途中断或超时时生成器抛出 IncompleteAudioError。
+        """
+        chunks = queue.Queue()
+        future = self.runtime.submit(self.generate_tts_stream_async(text, chunks.put, language, format))
+        future.add_done_callback(lambda _: chunks.put(None))
         
+        def receive():
+            try:
+                while True:
+                    try:
+                        chunk = chunks.get(timeout=self.request_timeout)
+                    except queue.Empty:
+                        logger.error(f"TTS 流式生成超时（{self.request_timeout} 秒），已取消")
+                        raise IncompleteAudioError(f"等待音频超过 {self.request_timeout} 秒")
+                    if chunk is None:
+                        if future.cancelled() or not future.result():
+                            raise IncompleteAudioError("TTS 流式生成失败或没有正常结束")
+                        return
+                    yield chunk
+            finally:
+                future.cancel()
+        
+        return receive(), future.cancel
+
+    @property
+    def pcm_sample_rate(self) -> int:
+        """请求 pcm 格式时 Fish Audio 返回的采样率"""
+        return self.tts_settings.get('sample_rate') or 44100
+
+    def generate_pcm(self, text: str, language: str = "ZH") -> Optional[Tuple[memoryview, int, int]]:
+        """合成并返回 (16-bit PCM 数据, 采样率, 声道数)，失败返回 None
+
+        供同进程调用方直接播放使用，不经过 HTTP 服务和磁盘文件。
+        直接向 Fish Audio 请求 pcm 裸数据，不需要解码。
+        """
         try:
-            result = loop.run_until_complete(
-                self.generate_tts_async(text, output_path, language)
-            )
-            return result
-        finally:
-            loop.close()
+            audio_bytes = self.runtime.run(self.collect_audio_async(text, language, 'pcm'),
+                                           timeout=self.request_timeout)
+        except Exception as e:
+            logger.error(f"TTS 生成失败: {e}")
+            return None
+        if not audio_bytes:
+            logger.error("未收到音频数据")
+            return None
+        # 分块传输可能在采样中间截断，丢弃末尾不完整的字节
+        return audio_bytes[:len(audio_bytes) // 2 * 2], self.pcm_sample_rate, 1
 
 # 创建服务实例
 fish_service = FishAudioService()
+# 合并同时到达的相同合成请求（相同文本、语言、格式和输出路径）
+endpoint_flight = SingleFlight()
+# 合并同时到达的相同流式请求，后到的请求共享同一次合成的音频块
+stream_flight = StreamFlight()
 
 def convert_opus_to_wav(opus_file, wav_file):
     """将 opus 文件转换为 wav 文件"""
@@ -335,7 +695,32 @@ def convert_opus_to_wav(opus_file, wav_file):
         logger.error(f"音频转换失败: {e}")
         return False
 
+def track_request(endpoint: str):
+    """统计端点的请求数（按状态码）、耗时和正在处理的请求数
+
+    流式端点的耗时只计到返回第一块音频为止。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            with metrics.tts_in_flight.track(endpoint=endpoint):
+                try:
+                    result = fn(*args, **kwargs)
+                    if isinstance(result, tuple):
+                        status = result[1]
+                    else:
+                        status = getattr(result, 'status_code', 200)
+                    return result
+                finally:
+                    metrics.tts_requests.inc(endpoint=endpoint, status=status)
+                    metrics.tts_request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+        return wrapper
+    return decorator
+
 @app.route('/', methods=['POST'])
+@track_request('/')
 def tts_endpoint():
     """TTS API 端点 - 与原有 API 兼容"""
     try:
@@ -354,13 +739,14 @@ def tts_endpoint():
         if not text:
             return jsonify({"error": "文本内容不能为空"}), 400
         
+        if file_type not in SUPPORTED_FORMATS:
+            return jsonify({"error": f"不支持的文件格式: {file_type}"}), 400
+        
         # 如果没有指定文件路径，生成一个临时路径
         if not file_path:
             # 使用文本的 MD5 作为文件名
             md5_hash = hashlib.md5(text.encode()).hexdigest()
-            # 首先生成 opus 文件
-            opus_path = os.path.join(fish_service.temp_dir, f"fish_tts_{md5_hash}.opus")
-            file_path = opus_path
+            file_path = os.path.join(fish_service.temp_dir, f"fish_tts_{md5_hash}.{file_type}")
         
         # 确保输出目录存在
         output_dir = os.path.dirname(file_path)
@@ -369,37 +755,17 @@ def tts_endpoint():
         
         logger.info(f"开始生成 TTS: 文本='{text[:50]}...', 语言={language}, 输出={file_path}")
         
-        # 生成 TTS (使用 opus 格式)
-        opus_file = file_path if file_path.endswith('.opus') else file_path.replace(f'.{file_type}', '.opus')
-        success = fish_service.generate_tts(text, opus_file, language)
-        
-        if success and os.path.exists(opus_file):
-            # 如果请求的是 WAV 格式，需要转换
-            if file_type == 'wav' and not file_path.endswith('.opus'):
-                wav_file = file_path
-                converted = convert_opus_to_wav_simple(opus_file, wav_file)
-                if converted:
-                    logger.info(f"TTS 转换成功: {wav_file}")
-                    # 删除临时 opus 文件
-                    try:
-                        os.remove(opus_file)
-                    except:
-                        pass
-                    return jsonify({
-                        "success": True,
-                        "file_path": os.path.abspath(wav_file),
-                        "message": "TTS 生成并转换成功"
-                    })
-                else:
-                    logger.error("音频格式转换失败")
-                    return jsonify({"error": "音频格式转换失败"}), 500
-            else:
-                logger.info(f"TTS 生成成功: {opus_file}")
-                return jsonify({
-                    "success": True,
-                    "file_path": os.path.abspath(opus_file),
-                    "message": "TTS 生成成功"
-                })
+        # 直接向 Fish Audio 请求调用方需要的格式，不再先生成 opus 再用 ffmpeg 转换
+        success = endpoint_flight.do((os.path.abspath(file_path), text, language, file_type),
+                                     fish_service.generate_tts, text, file_path, language, format=file_type)
+        
+        if success and os.path.exists(file_path):
+            logger.info(f"TTS 生成成功: {file_path}")
+            return jsonify({
+                "success": True,
+                "file_path": os.path.abspath(file_path),
+                "message": "TTS 生成成功"
+            })
         else:
             logger.error("TTS 生成失败")
             return jsonify({"error": "TTS 生成失败"}), 500
@@ -408,6 +774,61 @@ def tts_endpoint():
         logger.error(f"API 处理错误: {e}")
         return jsonify({"error": f"服务器错误: {str(e)}"}), 500
 
+@app.route('/stream', methods=['POST'])
+@track_request('/stream')
+def stream_endpoint():
+    """流式 TTS 端点 - 收到 Fish Audio 的音频块后立即通过分块传输返回给客户端
+
+    请求参数与 / 相同，format 默认为 pcm（16-bit 小端单声道），
+    采样率和声道数在 X-Sample-Rate、X-Channels 响应头中给出。
+    """
+    data = request.get_json(silent=True) if request.is_json else request.form.to_dict()
+    if not data:
+        return jsonify({"error": "没有提供数据"}), 400
+    
+    text = data.get('text', '')
+    language = data.get('language', 'ZH')
+    audio_format = data.get('format', 'pcm')
+    
+    if not text:
+        return jsonify({"error": "文本内容不能为空"}), 400
+    if audio_format not in SUPPORTED_FORMATS:
+        return jsonify({"error": f"不支持的音频格式: {audio_format}"}), 400
+    
+    logger.info(f"开始流式生成 TTS: 文本='{text[:50]}...', 语言={language}, 格式={audio_format}")
+    opened = stream_flight.open(
+        (text, language, audio_format),
+        lambda: (None, *fish_service.open_audio_stream(text, language, audio_format)))
+    if opened is None:
+        logger.error("TTS 流式生成失败")
+        return jsonify({"error": "TTS 生成失败"}), 500
+    chunks = opened[1]
+    # 先取到第一块再返回响应，合成失败时仍然可以返回错误状态码
+    try:
+        first = next(chunks, None)
+    except IncompleteAudioError:
+        first = None
+    if first is None:
+        chunks.close()
+        logger.error("TTS 流式生成失败")
+        return jsonify({"error": "TTS 生成失败"}), 500
+    
+    def generate():
+        try:
+            yield first
+            yield from chunks
+        except IncompleteAudioError as e:
+            # 不发送结束分块，客户端据此得知数据不完整，不会写入缓存
+            logger.error(f"TTS 流式生成中断: {e}")
+            raise
+        finally:
+            chunks.close()
+    
+    headers = {'X-Audio-Format': audio_format, 'X-Channels': '1'}
+    if audio_format in ('pcm', 'wav'):
+        headers['X-Sample-Rate'] = str(fish_service.pcm_sample_rate)
+    return Response(generate(), mimetype='application/octet-stream', headers=headers)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
@@ -417,6 +838,13 @@ def health_check():
         "timestamp": time.time()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """运行指标（Prometheus 文本格式）"""
+    for model, idle in list(fish_service.pool.idle.items()):
+        metrics.fish_pool_idle.set(len(idle), model=model)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/config', methods=['GET'])
 def get_config():
     """获取当前配置"""
@@ -465,23 +893,31 @@ class FishAudioServer:
             logger.error("请先在 config.ini 中配置 FISH_REFERENCE_ID")
             return False
         
+        # 先绑定端口，确认服务器可以启动后再启动合成服务，端口被占用时不留下后台线程和连接
+        try:
+            self.server = make_server(self.host, self.port, app, threaded=True)
+        # 端口被占用时 werkzeug 会调用 sys.exit
+        except (Exception, SystemExit) as e:
+            logger.error(f"服务器启动失败: {e}")
+            self.server = None
+            return False
+        logger.info(f"🐟 Fish Audio TTS 服务器启动在 http://{self.host}:{self.port}")
+        logger.info(f"📋 健康检查: http://{self.host}:{self.port}/health")
+        logger.info(f"⚙️ 配置信息: http://{self.host}:{self.port}/config")
+        
+        # 启动事件循环线程并预先建立 WebSocket 连接，首次合成不再等待握手
+        fish_service.start()
+        
         def run_server():
             try:
-                self.server = make_server(self.host, self.port, app, threaded=True)
-                logger.info(f"🐟 Fish Audio TTS 服务器启动在 http://{self.host}:{self.port}")
-                logger.info(f"📋 健康检查: http://{self.host}:{self.port}/health")
-                logger.info(f"⚙️ 配置信息: http://{self.host}:{self.port}/config")
-                self.running = True
                 self.server.serve_forever()
             except Exception as e:
-                logger.error(f"服务器启动失败: {e}")
+                logger.error(f"服务器运行出错: {e}")
                 self.running = False
         
+        self.running = True
         self.thread = threading.Thread(target=run_server, daemon=True)
         self.thread.start()
-        
-        # 等待一小段时间确保服务器启动
-        time.sleep(1)
         return self.running
     
     def stop(self):
@@ -492,6 +928,7 @@ class FishAudioServer:
             self.running = False
             if self.thread:
                 self.thread.join(timeout=5)
+            fish_service.close()
             logger.info("Fish Audio TTS 服务器已停止")
 
 # 全局服务器实例
@@ -0,0 +1,165 @@
+"""
+延迟追踪
+每条消息分配一个 id，记录从热键到第一个采样写入设备的各个阶段的时间点。
+每条消息的明细写入按大小轮转的 JSONL 文件，各阶段耗时的 p50/p95/p99 保存在内存中。
+
+用法:
+    with utterance(text):
+        mark('clipboard')        # 与上一个时间点之间的耗时记为 clipboard 阶段
+        ...
+    run = bind(fn)               # 交给其他线程执行时保持同一条消息的追踪
+"""
+
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+_current = contextvars.ContextVar('latency_trace', default=None)
+_ids = itertools.count(1)
+
+
+class Trace:
+    """一条消息的追踪记录"""
+
+    def __init__(self, text=''):
+        self.id = f'{os.getpid():x}-{next(_ids)}'
+        self.text = text
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.last = self.start
+        # (阶段, 距离开始的毫秒数, 距离上一个时间点的毫秒数)
+        self.stages: List[Tuple[str, float, float]] = []
+        self.lock = threading.Lock()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        with self.lock:
+            self.stages.append((stage, (now - self.start) * 1000, (now - self.last) * 1000))
+            self.last = now
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'id': self.id,
+                'time': self.started_at,
+                'text': self.text[:50],
+                'total_ms': round((self.last - self.start) * 1000, 2),
+                'stages': [{'stage': stage, 'at_ms': round(at, 2), 'ms': round(ms, 2)}
+                           for stage, at, ms in self.stages],
+            }
+
+
+class LatencyTracer:
+    """收集各阶段耗时，保存最近 window 条记录用于计算分位数"""
+
+    def __init__(self, window=500):
+        self.enabled = True
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('latency_trace')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def configure(self, enabled=True, path='./temp/latency.jsonl', max_bytes=1024 * 1024, backups=3):
+        """设置是否启用以及明细文件的位置，path 为空时只在内存中统计"""
+        self.enabled = enabled
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        if enabled and path:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+                                                           backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def record(self, trace: Trace):
+        data = trace.to_dict()
+        with self.lock:
+            for item in data['stages']:
+                self.samples.setdefault(item['stage'], deque(maxlen=self.window)).append(item['ms'])
+            self.samples.setdefault('total', deque(maxlen=self.window)).append(data['total_ms'])
+        if self.logger.handlers:
+            self.logger.info(json.dumps(data, ensure_ascii=False))
+        breakdown = ', '.join(f"{item['stage']} {item['ms']:.0f}" for item in data['stages'])
+        print(f"[{trace.id}] 总耗时 {data['total_ms']:.0f} ms: {breakdown}")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各阶段最近耗时（毫秒）的 p50/p95/p99"""
+        with self.lock:
+            snapshot = {stage: sorted(values) for stage, values in self.samples.items()}
+        return {stage: {'count': len(values),
+                        'p50': percentile(values, 50),
+                        'p95': percentile(values, 95),
+                        'p99': percentile(values, 99)}
+                for stage, values in snapshot.items() if values}
+
+
+def percentile(sorted_values, q):
+    """已排序数据的分位数（线性插值）"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+tracer = LatencyTracer()
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def utterance(text=''):
+    """开始一条消息的追踪；已经在追踪中时沿用外层的记录，由外层结束"""
+    trace = _current.get()
+    if trace is not None or not tracer.enabled:
+        if trace is not None and text:
+            trace.text = text
+        yield trace
+        return
+    trace = Trace(text)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.mark('done')
+        tracer.record(trace)
+
+
+def mark(stage):
+    """记录当前消息到达某个阶段，没有进行中的追踪时不做任何事"""
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(stage)
+
+
+def bind(fn: Callable) -> Callable:
+    """让 fn 在其他线程中执行时仍然属于当前消息的追踪"""
+    context = contextvars.copy_context()
+    # 同一个 Context 不能同时在多个线程中进入，每次调用使用一份副本
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def bind_coroutine(coro):
+    """让提交到其他事件循环的协程仍然属于当前消息的追踪"""
+    trace = _current.get()
+    if trace is None:
+        return coro
+
+    async def run():
+        _current.set(trace)
+        return await coro
+    return run()
@@ -0,0 +1,220 @@
+"""
+运行指标
+进程内的计数器、仪表和直方图，以 Prometheus 文本格式输出（/metrics 端点）
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+# 默认的延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类，labels 为标签名，每组标签值对应一个独立的序列"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """只增不减的计数"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        if not self.label_names:
+            # 没有标签的指标从 0 开始输出
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+                for key, value in items]
+
+
+class Gauge(Metric):
+    """可增可减的当前值，如正在处理的请求数"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        if not self.label_names:
+            # 没有标签的指标从 0 开始输出
+            self.values[()] = 0
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """执行期间计数加一"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+                for key, value in items]
+
+
+class Histogram(Metric):
+    """按分桶统计的分布，用于延迟等指标"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数(不累计), 总和, 总数]
+        self.values: Dict[Tuple[str, ...], list] = {}
+        if not self.label_names:
+            self.values[()] = self._new_entry()
+
+    def _new_entry(self):
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self._new_entry()
+                self.values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的执行时间（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self.lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labels, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labels, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self._get(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+# 合成服务
+tts_requests = registry.counter('tts_http_requests_total', 'HTTP 合成请求数', ('endpoint', 'status'))
+tts_request_seconds = registry.histogram('tts_http_request_seconds', 'HTTP 合成请求耗时（秒）', ('endpoint',))
+tts_in_flight = registry.gauge('tts_http_requests_in_flight', '正在处理的 HTTP 合成请求数', ('endpoint',))
+fish_pool_idle = registry.gauge('fish_pool_idle_connections', '连接池中的空闲连接数', ('model',))
+fish_sessions_in_flight = registry.gauge('fish_sessions_in_flight', '正在进行的 Fish Audio 合成会话数')
+fish_connect_seconds = registry.histogram('fish_websocket_connect_seconds', 'Fish Audio WebSocket 建立连接耗时（秒）')
+fish_connect_failures = registry.counter('fish_websocket_connect_failures_total', 'Fish Audio WebSocket 连接失败次数')
+fish_first_chunk_seconds = registry.histogram('fish_first_chunk_seconds', '发送文本到收到第一块音频的耗时（秒）')
+fish_bytes_received = registry.counter('fish_audio_bytes_received_total', '从 Fish Audio 收到的音频字节数')
+# 缓存与回退
+tts_cache_lookups = registry.counter('tts_cache_lookups_total', '每条消息的合成缓存查询结果', ('result',))
+tts_fallbacks = registry.counter('tts_fallback_total', '合成失败回退到其他引擎的次数', ('engine', 'fallback'))
@@ -0,0 +1,206 @@
+"""
+重复请求合并
+同一个键的请求同时到达时只执行一次，其余请求等待并共享这一次的结果；
+流式请求共享同一份逐块到达的数据
+"""
+
+import threading
+
+
+class _Call:
+    """一次正在执行的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = 0
+
+
+class SingleFlight:
+    """按键合并并发的相同请求，适用于合成这类耗时且结果相同的操作"""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)，同一个键已有调用在执行时等待它的结果
+
+        fn 抛出的异常同样会传给所有等待者。fn 内部不能再以相同的键调用 do，否则会等待自己。
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+            else:
+                call.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            if call.shared:
+                print(f"合并了 {call.shared} 个相同的请求")
+            call.done.set()
+        return call.result
+
+    def in_flight(self, key):
+        """该键是否有调用正在执行"""
+        with self.lock:
+            return key in self.calls
+
+
+class _Stream:
+    """一次正在进行的流式调用，收到的数据块都保留下来，后加入的订阅者从头重放"""
+
+    def __init__(self):
+        self.opened = False
+        self.meta = None
+        self.cancel = None
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.subscribers = 0
+        self.shared = 0
+
+
+class StreamFlight:
+    """按键合并并发的相同流式请求
+
+    第一个请求打开数据源并在后台线程中读取，同一个键的其他请求订阅同一份数据：
+    先收到已经到达的数据块，再继续接收新的数据块。所有订阅者都离开后才取消数据源。
+    """
+
+    def __init__(self):
+        self.streams = {}
+        self.cond = threading.Condition()
+
+    def open(self, key, open_fn, on_complete=None):
+        """
+        打开或加入 key 对应的流
+
+        Args:
+            open_fn: 打开数据源，返回 (meta, 数据块迭代器, cancel)，失败返回 None。
+                cancel 可以在任意线程调用，调用后迭代器应尽快结束
+            on_complete: 数据源完整读完时以 (meta, 数据块列表) 调用一次，例如写入缓存
+
+        Returns:
+            (meta, 订阅迭代器)，打开失败返回 None。数据源的异常会在迭代时抛给每个订阅者，
+            不再需要数据时应关闭订阅迭代器。
+        """
+        with self.cond:
+            stream = self.streams.get(key)
+            leader = stream is None
+            if leader:
+                stream = _Stream()
+                self.streams[key] = stream
+            else:
+                stream.shared += 1
+            stream.subscribers += 1
+
+        if leader:
+            opened = None
+            try:
+                opened = open_fn()
+            finally:
+                with self.cond:
+                    stream.opened = True
+                    if opened is None:
+                        stream.done = True
+                        del self.streams[key]
+                    else:
+                        stream.meta, chunks, stream.cancel = opened
+                    self.cond.notify_all()
+            if opened is None:
+                return None
+            threading.Thread(target=self._pump, args=(key, stream, chunks, on_complete),
+                             name='stream-flight', daemon=True).start()
+        else:
+            with self.cond:
+                while not stream.opened:
+                    self.cond.wait()
+                if stream.cancel is None:
+                    stream.subscribers -= 1
+                    return None
+        return stream.meta, self._subscribe(stream, key)
+
+    def _pump(self, key, stream, chunks, on_complete):
+        """在后台读取数据源，所有订阅者都离开后停止"""
+        complete = False
+        try:
+            for chunk in chunks:
+                with self.cond:
+                    if stream.cancelled:
+                        break
+                    stream.chunks.append(chunk)
+                    self.cond.notify_all()
+            else:
+                complete = not stream.cancelled
+        except BaseException as e:
+            stream.error = e
+        finally:
+            # 提前停止时关闭生成器，释放连接
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        if complete and on_complete is not None:
+            try:
+                on_complete(stream.meta, stream.chunks)
+            except Exception as e:
+                print(f"WARN: 流式结果处理失败: {e}")
+        with self.cond:
+            stream.done = True
+            if self.streams.get(key) is stream:
+                del self.streams[key]
+            self.cond.notify_all()
+        if stream.shared:
+            print(f"合并了 {stream.shared} 个相同的流式请求")
+
+    def _subscribe(self, stream, key):
+        index = 0
+        try:
+            while True:
+                with self.cond:
+                    while index >= len(stream.chunks) and not stream.done:
+                        self.cond.wait()
+                    pending = stream.chunks[index:]
+                    index += len(pending)
+                    done = stream.done
+                yield from pending
+                if done:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+        finally:
+            self._leave(stream, key)
+
+    def _leave(self, stream, key):
+        with self.cond:
+            stream.subscribers -= 1
+            if stream.subscribers or stream.done:
+                return
+            # 没有订阅者了，剩余的数据不再需要
+            stream.cancelled = True
+            if self.streams.get(key) is stream:
+                del self.streams[key]
+            self.cond.notify_all()
+        stream.cancel()
+
+    def in_flight(self, key):
+        """该键是否有流正在进行"""
+        with self.cond:
+            return key in self.streams
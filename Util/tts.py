@@ -1,35 +1,110 @@
+import concurrent.futures
 import json
 import os
-import hashlib
+import queue
+import re
+import shutil
 import threading
 import time
-import pyttsx3
+import wave
 import requests
 
-do_not_use_cache = True
+from Util import latency_trace, metrics
+from Util.loadSetting import getConfigDict
+from Util.Pyttsx3Worker import Pyttsx3Worker
+from Util.single_flight import SingleFlight, StreamFlight
+from Util.tts_cache import TTSCache
+
+# 每个缓存目录对应一个缓存实例
+tts_caches = {}
+tts_cache_lock = threading.Lock()
+# 各引擎影响合成结果的参数，作为缓存键的一部分
+cache_params = {}
+# 缓存文件在后台单线程写入，不占用播放路径
+cache_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts-cache-writer')
+pending_writes = set()
+pending_writes_lock = threading.Lock()
+# 合并同时到达的相同合成请求
+synthesis_flight = SingleFlight()
+# 合并同时到达的相同流式合成，后到的请求播放同一份音频块
+stream_flight = StreamFlight()
+# pyttsx3 合成线程，进程内共用一个已初始化的引擎
+pyttsx3_worker = None
+pyttsx3_worker_lock = threading.Lock()
+# 单条 pyttsx3 合成的默认超时（秒），包括排队等待的时间
+PYTTSX3_TIMEOUT = 30
+
+# 句子边界：句末标点（及紧随的右引号/右括号）之后，英文句号后跟空白，或换行
+SENTENCE_BOUNDARY = re.compile(
+    r'(?<=[。！？!?；;…])(?![。！？!?；;…”’」』）)"\'])\s*'
+    r'|(?<=[。！？!?；;…][”’」』）)"\'])\s*'
+    r'|(?<=\.)\s+'
+    r'|\s*\n\s*'
+)
+
+def split_sentences(text, min_length=4):
+    """按中英文句子边界切分文本，过短的片段与相邻句子合并"""
+    sentences = []
+    for part in SENTENCE_BOUNDARY.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        # 只有标点（如连续的 "！！" 或右引号）或上一句过短时并入上一句
+        if sentences and (not any(ch.isalnum() for ch in part) or len(sentences[-1]) < min_length):
+            last = sentences[-1]
+            sep = ' ' if last[-1].isascii() and part[0].isascii() and part[0].isalnum() else ''
+            sentences[-1] = last + sep + part
+        else:
+            sentences.append(part)
+    return sentences
+
+def get_pyttsx3_worker():
+    """进程内共用的 pyttsx3 合成线程，第一次调用时启动并初始化引擎"""
+    global pyttsx3_worker
+    with pyttsx3_worker_lock:
+        if pyttsx3_worker is None:
+            config = getConfigDict()
+            pyttsx3_worker = Pyttsx3Worker(config.get('PYTTSX3_RATE', '').strip(),
+                                           config.get('PYTTSX3_VOICE', '').strip())
+            pyttsx3_worker.start()
+        return pyttsx3_worker
+
+def close_pyttsx3_worker():
+    """停止 pyttsx3 合成线程（退出前调用）"""
+    global pyttsx3_worker
+    with pyttsx3_worker_lock:
+        worker, pyttsx3_worker = pyttsx3_worker, None
+    if worker is not None:
+        worker.close()
+
+def replace_pyttsx3_worker(worker):
+    """放弃卡住的合成线程，换用重新初始化引擎的新线程，排队中的任务转交给新线程"""
+    global pyttsx3_worker
+    with pyttsx3_worker_lock:
+        if pyttsx3_worker is not worker:
+            # 其他调用已经替换过
+            return
+        pyttsx3_worker = None
+    print("WARN: pyttsx3 合成超时，重建引擎和合成线程")
+    pending = worker.abandon()
+    get_pyttsx3_worker().requeue(pending)
 
 def pyttsx3_tts(text, filepath):
     # 文件不存在，使用pyttsx3合成wav文件
+    # 合成在常驻线程中进行，引擎、驱动和语速音色设置都只初始化一次
+    config = getConfigDict()
     try:
-        engine = pyttsx3.init('sapi5')
-    except:
-        try:
-            engine = pyttsx3.init()
-        except:
-            try:
-                engine = pyttsx3.init('nsss')
-            except:
-                print("WARN: No TTS engine found")
-                engine = pyttsx3.init('dummy')
-    # 设置输出到文件
-    engine.save_to_file(text, filepath)
-    # 执行TTS
-    engine.runAndWait()
-    # 关闭引擎
-    engine.stop()
-
-    # 返回文件的绝对路径
-    return os.path.abspath(filepath)
+        timeout = float(config.get('PYTTSX3_TIMEOUT', '').strip() or PYTTSX3_TIMEOUT)
+    except ValueError:
+        timeout = PYTTSX3_TIMEOUT
+    worker = get_pyttsx3_worker()
+    try:
+        return worker.synthesize(text, filepath, timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        # 一次卡住的 runAndWait 不能阻塞之后所有的离线合成
+        if worker.stuck:
+            replace_pyttsx3_worker(worker)
+        raise TimeoutError(f"pyttsx3 合成超过 {timeout:g} 秒未完成")
 
 def send_request(url, method, params=None, headers=None, proxies=None, body=None, encoding='utf-8', timeout=10, verify=True):
     """
@@ -80,12 +155,73 @@ def send_request(url, method, params=None, headers=None, proxies=None, body=None
 
 tts_lock = threading.Lock()
 def api_tts(text, filepath, language="ZH"):
+    """本地 API TTS（端口 10086），合成到 filepath，成功返回文件绝对路径，失败返回 None"""
     # ZH|JA
-    result = send_request("http://127.0.0.1:10086/",'POST',body={"text": text, "language": language, 'file_path' : os.path.abspath(filepath), 'file_type' : 'wav'})
-    return result
+    try:
+        result = send_request("http://127.0.0.1:10086/",'POST',body={"text": text, "language": language, 'file_path' : os.path.abspath(filepath), 'file_type' : 'wav'})
+    except Exception as e:
+        print(f"API TTS 调用失败: {e}")
+        return None
+    # 接口返回 {"success", "file_path"} 形式的 JSON（与 Fish Audio 服务相同），或直接返回文件路径
+    path = filepath
+    try:
+        response_data = json.loads(result)
+    except ValueError:
+        response_data = None
+    if isinstance(response_data, dict):
+        if response_data.get('success') is False or 'error' in response_data:
+            print(f"API TTS 错误: {response_data.get('error', '未知错误')}")
+            return None
+        path = response_data.get('file_path') or filepath
+    elif result.strip() and os.path.isfile(result.strip()):
+        path = result.strip()
+    if not os.path.isfile(path):
+        print(f"API TTS 没有生成音频文件: {path}")
+        return None
+    if os.path.abspath(path) != os.path.abspath(filepath):
+        # 接口把文件写到了别处时复制到请求的位置，结果才能登记到缓存
+        shutil.copyfile(path, filepath)
+    return os.path.abspath(filepath)
+
+def get_inprocess_fish_service():
+    """Fish Audio 服务在本进程中运行时返回服务实例，否则返回 None"""
+    try:
+        from Util.fish_audio_server import fish_service
+    except ImportError:
+        return None
+    return fish_service if fish_service.runtime.running else None
+
+
+def fish_audio_tts_pcm(text, language="ZH"):
+    """进程内直接调用 FishAudioService，返回 (PCM 数据, 采样率, 声道数)
+
+    不经过本地 HTTP 服务和磁盘文件；服务不在本进程或合成失败时返回 None。
+    """
+    service = get_inprocess_fish_service()
+    if service is None:
+        return None
+    return synthesis_flight.do(('fish_pcm', text, language), service.generate_pcm, text, language)
+
+
+def write_wav(filepath, pcm, frame_rate, channels):
+    """将 16-bit PCM 数据写入 wav 文件"""
+    with wave.open(filepath, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(frame_rate)
+        wf.writeframes(pcm)
+
 
 def fish_audio_tts(text, filepath, language="ZH"):
     """Fish Audio TTS API 调用"""
+    # 服务在本进程中运行时直接调用，HTTP 服务只留给外部客户端
+    if get_inprocess_fish_service() is not None:
+        result = fish_audio_tts_pcm(text, language)
+        if result is None:
+            return None
+        write_wav(filepath, *result)
+        return os.path.abspath(filepath)
+
     try:
         # 调用本地 Fish Audio API 服务器
         result = send_request(
@@ -99,6 +235,7 @@ def fish_audio_tts(text, filepath, language="ZH"):
             },
             headers={'Content-Type': 'application/json'}
         )
+        latency_trace.mark('http_request')
         
         # 解析响应
         import json
@@ -116,42 +253,321 @@ def fish_audio_tts(text, filepath, language="ZH"):
         return None
 
 
-def tts_if_not_exists(text, directory, tts_engine = 'pyttsx3_tts'):
-    global do_not_use_cache
-    # 计算字符串的MD5值
-    md5_hash = hashlib.md5(text.encode()).hexdigest()
+def align_chunks(chunks, frame_bytes=2):
+    """网络分块可能在采样中间截断，不完整的字节留到下一块，保证每块都是完整的帧"""
+    pending = b''
+    for data in chunks:
+        data = pending + data if pending else data
+        usable = len(data) - len(data) % frame_bytes
+        pending = data[usable:]
+        if usable:
+            yield data[:usable]
+
+
+def play_pcm_stream(chunks, sample_rate, channels, audio_player, device_id, volume, schedule=None, loudness=None):
+    """播放逐块到达的 16-bit PCM
+
+    schedule(play) 负责在轮到播放时调用 play 并返回它是否被执行，不提供时直接播放。
+    loudness 为计算响度归一化增益使用的响度（见 AudioPlayer.stream_loudness）。
+    返回 (状态, 是否完整读完)。读完时状态为是否播放成功；
+    没有读完时，被打断或被调度器丢弃视为已处理，状态为 True。
+    """
+    drained = []
+
+    def tee():
+        yield from chunks
+        drained.append(True)
+
+    result = {'played': False, 'interrupted': False}
+
+    def play():
+        try:
+            result['played'] = audio_player.play_stream(tee(), sample_rate, device_id, volume, channels, loudness)
+        except Exception as e:
+            print(f"流式播放出错: {e}")
+        result['interrupted'] = audio_player.interrupted
+
+    executed = schedule(play) if schedule is not None else (play() or True)
+    played = result['played']
+    if not drained:
+        return played or result['interrupted'] or not executed, False
+    return played, True
+
+
+def play_shared_stream(text, directory, tts_engine, language, open_stream, audio_player, device_id, volume,
+                       schedule=None):
+    """播放相同文本正在进行的流式合成，没有时由 open_stream 开始一次新的合成
+
+    open_stream() 返回 ((采样率, 声道数), PCM 块迭代器, 取消函数)，失败返回 None。
+    同时到达的相同请求共享同一次合成，各自从头播放；数据完整收到后写入一次缓存，
+    所有请求都不再需要数据时才取消合成。返回值与 fish_audio_tts_stream 相同。
+
+    流式播放按引擎的响度估计计算增益，这个值随缓存一起保存，重播时使用相同的增益。
+    """
+    key = (os.path.abspath(directory), get_cache_key(text, tts_engine), language)
+
+    def open_with_loudness():
+        opened = open_stream()
+        if opened is None:
+            return None
+        meta, chunks, cancel = opened
+        # 同一次合成的所有请求使用打开时的同一个估计值
+        return meta + (audio_player.stream_loudness(tts_engine),), chunks, cancel
+
+    def on_complete(meta, chunks):
+        sample_rate, channels, loudness = meta
+        pcm = b''.join(chunks)
+        audio_player.update_stream_loudness(tts_engine, pcm, sample_rate, channels)
+        # 在读取线程中写完缓存再结束这次合成，之后到达的请求可以直接命中缓存
+        cache_pcm(text, directory, tts_engine, pcm, sample_rate, channels, background=False, loudness=loudness)
+
+    opened = stream_flight.open(key, open_with_loudness, on_complete)
+    if opened is None:
+        return False
+    (sample_rate, channels, loudness), chunks = opened
+    try:
+        status, _ = play_pcm_stream(chunks, sample_rate, channels, audio_player, device_id, volume, schedule,
+                                    loudness)
+    finally:
+        # 播放被打断或被丢弃时退出订阅，没有其他请求在等待时取消合成
+        chunks.close()
+    return status
+
+
+def fish_audio_tts_stream(text, audio_player, device_id, volume, language="ZH", directory='./temp',
+                          schedule=None):
+    """Fish Audio 流式合成并播放，收到第一块音频就开始输出
+
+    Fish Audio 服务在本进程中时直接调用，否则通过服务的 /stream 接口流式获取。
+    合成立即开始，完整收到后结果写入缓存。
+    返回 False 表示合成失败、没有可播放的音频，调用方可以回退到文件模式；
+    播放被打断或被调度器丢弃时返回 True。
+    """
+    fish_service = get_inprocess_fish_service()
+    if fish_service is None:
+        config = getConfigDict()
+        url = (f"http://{config.get('FISH_SERVER_HOST', '127.0.0.1')}:"
+               f"{config.get('FISH_SERVER_PORT', '10087')}/stream")
+        return http_tts_stream(text, audio_player, device_id, volume, url, language, directory, schedule)
+
+    def open_stream():
+        # 直接请求 pcm 裸数据，收到即可播放，不需要解码进程
+        chunks, cancel = fish_service.open_audio_stream(text, language, format='pcm')
+        return (fish_service.pcm_sample_rate, 1), align_chunks(chunks), cancel
+
+    return play_shared_stream(text, directory, 'fish_audio_tts', language, open_stream,
+                              audio_player, device_id, volume, schedule)
+
+
+def open_tts_stream(url, text, language="ZH", timeout=10):
+    """请求流式合成接口，返回 (响应, 采样率, 声道数)，失败返回 None"""
+    try:
+        response = requests.post(url, json={'text': text, 'language': language, 'format': 'pcm'},
+                                 stream=True, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"流式合成请求失败: {e}")
+        return None
+    latency_trace.mark('http_stream_response')
+    if response.status_code != 200:
+        print(f"流式合成请求失败: HTTP {response.status_code} {response.text[:200]}")
+        response.close()
+        return None
+    sample_rate = int(response.headers.get('X-Sample-Rate', '44100'))
+    channels = int(response.headers.get('X-Channels', '1'))
+    return response, sample_rate, channels
+
+
+def http_tts_stream(text, audio_player, device_id, volume, url, language="ZH", directory='./temp',
+                    schedule=None, tts_engine='fish_audio_tts'):
+    """通过 HTTP 流式接口合成并播放，收到第一块音频就开始输出
+
+    接口接受 {"text", "language", "format": "pcm"} 的 JSON 请求，以分块传输返回 16-bit PCM，
+    采样率和声道数放在 X-Sample-Rate、X-Channels 响应头中（即 Fish Audio 服务的 /stream 接口）。
+    返回值与 fish_audio_tts_stream 相同。
+    """
+    def open_stream():
+        opened = open_tts_stream(url, text, language)
+        if opened is None:
+            return None
+        response, sample_rate, channels = opened
+
+        def read():
+            try:
+                # chunk_size=None 时收到多少数据就产出多少，不等待凑满固定大小
+                yield from align_chunks(response.iter_content(chunk_size=None), 2 * channels)
+            finally:
+                # 没有读完时关闭连接，服务端随之取消合成
+                response.close()
+
+        return (sample_rate, channels), read(), response.close
+
+    return play_shared_stream(text, directory, tts_engine, language, open_stream,
+                              audio_player, device_id, volume, schedule)
+
+
+def get_tts_cache(directory):
+    """获取目录对应的缓存实例，磁盘预算由 TTS_CACHE_MAX_MB 配置"""
+    with tts_cache_lock:
+        cache = tts_caches.get(directory)
+        if cache is None:
+            config = getConfigDict()
+            max_mb = float(config.get('TTS_CACHE_MAX_MB', '200'))
+            cache = TTSCache(directory, int(max_mb * 1024 * 1024))
+            tts_caches[directory] = cache
+        return cache
+
+
+def get_cache_params(tts_engine):
+    """影响合成结果的参数（音色、语速、温度等），变化后缓存自然失效"""
+    if tts_engine not in cache_params:
+        config = getConfigDict()
+        if tts_engine == 'fish_audio_tts':
+            keys = ('FISH_REFERENCE_ID', 'FISH_MODEL', 'FISH_SPEED',
+                    'FISH_TEMPERATURE', 'FISH_TOP_P', 'FISH_VOLUME', 'FISH_SAMPLE_RATE')
+            cache_params[tts_engine] = {key: config.get(key, '') for key in keys}
+        elif tts_engine == 'pyttsx3_tts':
+            # 只记录设置了的参数，未设置语速和音色时缓存键保持不变
+            keys = ('PYTTSX3_RATE', 'PYTTSX3_VOICE')
+            cache_params[tts_engine] = {key: config[key].strip() for key in keys if config.get(key, '').strip()}
+        else:
+            cache_params[tts_engine] = {}
+    return cache_params[tts_engine]
+
+
+def get_cache_key(text, tts_engine):
+    return TTSCache.make_key(text, tts_engine, get_cache_params(tts_engine))
+
+
+def get_cached_tts(text, directory, tts_engine='pyttsx3_tts', count_lookup=False):
+    """查询缓存，命中时返回 wav 文件绝对路径，否则返回 None
+
+    count_lookup 为 True 时计入缓存命中率指标，每条消息只应计入一次。
+    """
+    cache = get_tts_cache(directory)
+    if not cache.enabled:
+        return None
+    path = cache.get(get_cache_key(text, tts_engine))
+    if count_lookup:
+        metrics.tts_cache_lookups.inc(result='hit' if path else 'miss')
+    return os.path.abspath(path) if path else None
+
+
+def get_cached_loudness(text, directory, tts_engine='pyttsx3_tts'):
+    """缓存中记录的首次播放时使用的响度，没有记录时返回 None（播放时实测）"""
+    return get_tts_cache(directory).loudness(get_cache_key(text, tts_engine))
+
+
+def cache_pcm(text, directory, tts_engine, pcm, frame_rate, channels, background=True, loudness=None):
+    """将内存中合成好的 PCM 写入缓存
+
+    默认在后台线程中写文件，调用方可以立即用内存中的数据播放；pcm 在写入完成前不能被修改。
+    loudness 为播放这段音频时使用的响度，与文件一起登记。
+    """
+    cache = get_tts_cache(directory)
+    if not cache.enabled:
+        return
+    key = get_cache_key(text, tts_engine)
+    path = cache.path_for(key)
+
+    def write():
+        try:
+            write_wav(path, pcm, frame_rate, channels)
+        except OSError as e:
+            print(f"WARN: 写入缓存失败: {e}")
+            return
+        cache.put(key, path, loudness)
+
+    if not background:
+        write()
+        return
+    future = cache_writer.submit(write)
+    with pending_writes_lock:
+        pending_writes.add(future)
+    future.add_done_callback(discard_pending_write)
+
+
+def discard_pending_write(future):
+    with pending_writes_lock:
+        pending_writes.discard(future)
+
+
+def wait_cache_writes(timeout=5):
+    """等待后台缓存写入完成（退出前调用）"""
+    with pending_writes_lock:
+        futures = list(pending_writes)
+    concurrent.futures.wait(futures, timeout=timeout)
+
+
+def tts_if_not_exists(text, directory, tts_engine = 'pyttsx3_tts', primary_failed=False, fallback=True):
+    """查询缓存，未命中时合成，返回 wav 文件绝对路径
+
+    primary_failed 为 True 表示调用方刚刚用 tts_engine 合成这段文本失败，直接使用回退引擎，不再重复请求。
+    fallback 为 False 时 tts_engine 失败不回退到 pyttsx3，直接返回 None（如批量合成，回退结果不会被缓存）。
+    """
+    cache = get_tts_cache(directory)
+    key = get_cache_key(text, tts_engine)
     
-    # 所有 TTS 引擎都使用 WAV 格式以确保兼容性
-    file_extension = 'wav'
+    # 检查缓存
+    if cache.enabled:
+        cached = cache.get(key)
+        latency_trace.mark('cache_lookup')
+        if cached:
+            return os.path.abspath(cached)
     
-    filename = f"{md5_hash}.{file_extension}"
-    filepath = os.path.join(directory, filename)
+    # 相同文本的合成正在进行时等待它的结果，不再重复合成同一个文件
+    return synthesis_flight.do((os.path.abspath(directory), key, primary_failed, fallback),
+                               synthesize_to_cache, text, cache, key, tts_engine, directory, primary_failed,
+                               fallback)
+
+
+def synthesize_to_cache(text, cache, key, tts_engine, directory, primary_failed=False, fallback=True):
+    """合成到缓存键对应的文件并登记到缓存，返回文件绝对路径；fallback 为 False 时合成失败返回 None"""
+    # 等待期间其他请求可能已经完成合成
+    if cache.enabled:
+        cached = cache.get(key)
+        if cached:
+            return os.path.abspath(cached)
+    
+    # 所有 TTS 引擎都使用 WAV 格式以确保兼容性
+    filepath = cache.path_for(key, 'wav')
     
-    # 检查文件是否存在于指定目录中
-    # 如果不使用缓存
-    if do_not_use_cache and os.path.exists(filepath):
+    # 不使用缓存时，同一文本的旧文件需要先删除
+    while not cache.enabled and os.path.exists(filepath):
         # 删除文件
         try:
             os.remove(filepath)
-        # 如果文件被占用，则等待一段时间后再次尝试
+        # 如果文件正在播放，则等待一段时间后再次尝试
         except PermissionError:
             time.sleep(0.1)
-            return tts_if_not_exists(text, directory, tts_engine)
     
-    if not os.path.exists(filepath):
-        if tts_engine == 'pyttsx3_tts':
+    # 回退引擎的结果不能登记在原引擎的缓存键下
+    cacheable = True
+    if tts_engine == 'pyttsx3_tts':
+        result = pyttsx3_tts(text, filepath)
+    elif tts_engine == 'api_tts':
+        result = api_tts(text, filepath)
+        if result is None:
+            if not fallback:
+                return None
+            print("API TTS 失败，回退到 pyttsx3")
+            metrics.tts_fallbacks.inc(engine=tts_engine, fallback='pyttsx3_tts')
             result = pyttsx3_tts(text, filepath)
-        elif tts_engine == 'api_tts':
-            result = api_tts(text, directory)
-        elif tts_engine == 'fish_audio_tts':
-            result = fish_audio_tts(text, filepath)
-            if result is None:
-                # Fish Audio 失败时回退到 pyttsx3
-                print("Fish Audio TTS 失败，回退到 pyttsx3")
-                result = pyttsx3_tts(text, filepath)
-        else:
-            raise ValueError("Invalid TTS engine specified.")
+            cacheable = False
+    elif tts_engine == 'fish_audio_tts':
+        result = None if primary_failed else fish_audio_tts(text, filepath)
+        if result is None:
+            if not fallback:
+                return None
+            # Fish Audio 失败时回退到 pyttsx3
+            print("Fish Audio TTS 失败，回退到 pyttsx3")
+            metrics.tts_fallbacks.inc(engine=tts_engine, fallback='pyttsx3_tts')
+            result = pyttsx3_tts(text, filepath)
+            cacheable = False
     else:
-        result = filepath
+        raise ValueError("Invalid TTS engine specified.")
+    latency_trace.mark(f'synthesize_{tts_engine}')
+    
+    if cacheable and os.path.abspath(result) == os.path.abspath(filepath):
+        cache.put(key, filepath)
     
     return os.path.abspath(result)
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+合成结果磁盘缓存
+以文本和合成参数的哈希作为键，按磁盘预算进行 LRU 淘汰，索引持久化保存
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTSCache:
+    """内容寻址的合成缓存，超出磁盘预算时淘汰最久未使用的文件"""
+
+    INDEX_NAME = 'tts_cache_index.json'
+    # 缓存文件名（缓存键 + 扩展名），目录中的其他文件不受缓存管理
+    FILE_PATTERN = re.compile(r'^[0-9a-f]{40}\.wav$')
+    # 最近修改过的未登记文件可能正在写入，启动清理时跳过
+    ORPHAN_GRACE_SECONDS = 60
+
+    def __init__(self, directory, max_bytes, save_interval=5.0):
+        """
+        初始化缓存
+
+        Args:
+            directory: 缓存文件所在目录
+            max_bytes: 磁盘预算（字节），为 0 时禁用缓存
+            save_interval: 仅有访问记录变化时，索引最短的保存间隔（秒）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+        self.index_path = os.path.join(directory, self.INDEX_NAME)
+        # key -> {'file': 文件名, 'size': 字节数, 'last_access': 时间戳, 'loudness': 播放时使用的响度（可选）}，
+        # 按最近使用排序
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_save = 0.0
+        # 淘汰时删除失败的文件名，之后重试
+        self.pending_deletes = set()
+        self._load()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(text, engine, params=None):
+        """根据文本、引擎与合成参数计算缓存键"""
+        payload = json.dumps({'text': text, 'engine': engine, 'params': params or {}},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, extension='wav'):
+        """缓存键对应的文件路径"""
+        return os.path.join(self.directory, f'{key}.{extension}')
+
+    def get(self, key):
+        """命中时返回文件路径并更新访问时间，否则返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.directory, entry['file'])
+            if not os.path.exists(path):
+                # 文件被外部删除，移除索引记录
+                self.total_bytes -= entry['size']
+                del self.entries[key]
+                self._save_locked(force=True)
+                return None
+            entry['last_access'] = time.time()
+            self.entries.move_to_end(key)
+            self.dirty = True
+            self._save_locked()
+            return path
+
+    def loudness(self, key):
+        """登记时记录的响度，没有记录时返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry.get('loudness') if entry is not None else None
+
+    def put(self, key, path, loudness=None):
+        """登记一个已写入缓存目录的文件，并按磁盘预算淘汰旧文件
+
+        loudness 为首次播放时使用的响度（如流式播放时的估计值），重播时使用相同的值保持音量一致。
+        """
+        if not self.enabled or not os.path.exists(path):
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old['size']
+            size = os.path.getsize(path)
+            # 同名文件重新写入后不能再被之前的淘汰删除
+            self.pending_deletes.discard(os.path.basename(path))
+            self.entries[key] = {
+                'file': os.path.basename(path),
+                'size': size,
+                'last_access': time.time()
+            }
+            if loudness is not None:
+                self.entries[key]['loudness'] = loudness
+            self.total_bytes += size
+            self._evict_locked()
+            self._save_locked(force=True)
+
+    def flush(self):
+        """将未保存的访问记录写入索引"""
+        with self.lock:
+            self._retry_deletes_locked()
+            if self.dirty:
+                self._save_locked(force=True)
+
+    def _delete_file(self, name):
+        """删除缓存文件，返回是否已不存在"""
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"WARN: 删除缓存文件失败 {name}: {e}")
+            return False
+        return True
+
+    def _retry_deletes_locked(self):
+        for name in list(self.pending_deletes):
+            if self._delete_file(name):
+                self.pending_deletes.discard(name)
+
+    def _evict_locked(self):
+        self._retry_deletes_locked()
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry['size']
+            # 文件正在播放等情况下可能删除失败，之后淘汰或保存时重试
+            if not self._delete_file(entry['file']):
+                self.pending_deletes.add(entry['file'])
+            print(f"缓存淘汰: {entry['file']}")
+
+    def _sweep_orphans(self):
+        """删除目录中没有登记在索引里的缓存文件（上次运行中删除失败或写入后未登记的文件）"""
+        indexed = {entry['file'] for entry in self.entries.values()}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            if name in indexed or not self.FILE_PATTERN.match(name):
+                continue
+            try:
+                if now - os.path.getmtime(os.path.join(self.directory, name)) < self.ORPHAN_GRACE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            if self._delete_file(name):
+                print(f"清理未登记的缓存文件: {name}")
+
+    def _load(self):
+        data = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"WARN: 读取缓存索引失败，将重建: {e}")
+        items = sorted(data.get('entries', {}).items(), key=lambda kv: kv[1].get('last_access', 0))
+        for key, entry in items:
+            # 丢弃已不存在的文件
+            path = os.path.join(self.directory, entry.get('file', ''))
+            if not os.path.isfile(path):
+                continue
+            entry['size'] = os.path.getsize(path)
+            self.entries[key] = entry
+            self.total_bytes += entry['size']
+        # 不使用缓存时合成结果也写在这个目录，不做清理
+        if self.enabled:
+            self._sweep_orphans()
+        self._evict_locked()
+
+    def _save_locked(self, force=False):
+        now = time.time()
+        if not force and now - self.last_save < self.save_interval:
+            return
+        tmp_path = self.index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+            self.last_save = now
+        except OSError as e:
+            print(f"WARN: 保存缓存索引失败: {e}")
@@ -1,3 +1,4 @@
+import queue
 import threading
 import time
 import os
@@ -11,9 +12,14 @@ from Util.AudioPlayer import AudioPlayer
 from Util.EnhancedHotKeyManager import EnhancedGlobalHotKeyManager
 from Util.loadSetting import getConfigDict
 from Util.SystemTrayIcon import SystemTrayIcon
-from Util.tts import tts_if_not_exists
+from Util.tts import tts_if_not_exists, fish_audio_tts_stream, http_tts_stream, fish_audio_tts_pcm, get_cached_tts, get_cached_loudness, cache_pcm, get_tts_cache, wait_cache_writes, split_sentences, get_pyttsx3_worker, close_pyttsx3_worker, get_inprocess_fish_service
 from Util.FloatingTextInput import FloatingTextInput
+from Util.LocalClipLibrary import LocalClipLibrary
+from Util.CachePrewarmer import CachePrewarmer
+from Util.batch_tts import read_lines
+from Util.PlaybackScheduler import PlaybackScheduler, PRIORITY_CLIP, PRIORITY_SYNTH
 from Util.admin_utils import is_admin
+from Util import latency_trace
 
 # 导入 Fish Audio 服务器
 try:
@@ -31,30 +37,169 @@ device_dict: Dict[str, int] = ap.get_audio_devices()
 
 def core():
     global device_id, volume, ap, tts_engine
-    print(device_id)
-    # 读取剪贴板
-    if setting_dict['ACTIVATION'] == "<ctrl>+x":
-        time.sleep(0.1)
-    text = pyperclip.paste()
-    print(f'读取剪贴板:{text}')
-    process_text_to_speech(text)
+    # 从按下热键开始追踪
+    with latency_trace.utterance():
+        print(device_id)
+        # 读取剪贴板
+        if setting_dict['ACTIVATION'] == "<ctrl>+x":
+            time.sleep(0.1)
+            latency_trace.mark('clipboard_wait')
+        text = pyperclip.paste()
+        latency_trace.mark('clipboard')
+        print(f'读取剪贴板:{text}')
+        process_text_to_speech(text)
+
+def schedule_playback(play, priority, label=''):
+    """提交到播放调度器并等待播放结束，返回是否完整播放（被丢弃或被打断时返回 False）"""
+    interrupted = []
+
+    def run():
+        latency_trace.mark('scheduler_wait')
+        play()
+        interrupted.append(ap.interrupted)
+
+    # 调度线程中的播放仍然记录在这条消息的追踪中
+    job = scheduler.submit(latency_trace.bind(run), priority=priority, interrupt=playback_interrupt, label=label)
+    return job.wait() and not any(interrupted)
+
+def prepare_playback(text, fish_failed=False):
+    """查找或合成文本对应的音频，返回 (播放函数, 优先级通道)
+
+    fish_failed 为 True 表示 Fish Audio 刚刚合成失败，直接使用回退引擎。
+    """
+    global device_id, volume, ap, tts_engine, local_library
+    # 查询{text}.wav是否在local目录下出现（忽略大小写、全半角与标点）
+    local_clip = local_library.lookup(text)
+    latency_trace.mark('local_lookup')
+    if local_clip:
+        print(f'查询到{local_clip}')
+        return lambda: ap.play_audio_on_device(local_clip, device_id, volume), PRIORITY_CLIP
+    # 查询合成缓存
+    cached = get_cached_tts(text, './temp', tts_engine)
+    if cached:
+        print(f'命中缓存{cached}')
+        # 流式播放过的片段按当时的响度计算增益，与首次播放音量一致
+        loudness = get_cached_loudness(text, './temp', tts_engine)
+        return lambda: ap.play_audio_on_device(cached, device_id, volume, loudness), PRIORITY_CLIP
+    # Fish Audio 服务在本进程中时直接取内存中的 PCM 播放，不经过本地 HTTP 和磁盘文件
+    if tts_engine == 'fish_audio_tts' and FISH_AUDIO_AVAILABLE and not fish_failed:
+        result = fish_audio_tts_pcm(text)
+        if result is not None:
+            pcm, frame_rate, channels = result
+            # 缓存文件在后台写入，播放直接使用内存中的数据
+            cache_pcm(text, './temp', tts_engine, pcm, frame_rate, channels)
+            return lambda: ap.play_pcm_on_device(pcm, frame_rate, channels, device_id, volume), PRIORITY_SYNTH
+        # 服务在本进程中时上面已经请求过一次，失败后不再经由 tts_if_not_exists 重复请求
+        fish_failed = get_inprocess_fish_service() is not None
+    # 合成
+    path = tts_if_not_exists(text, './temp', tts_engine, primary_failed=fish_failed)
+    print(f'音频合成{path}')
+    loudness = get_cached_loudness(text, './temp', tts_engine)
+    return lambda: ap.play_audio_on_device(path, device_id, volume, loudness), PRIORITY_SYNTH
+
+def play_pipelined(text, sentences, fish_failed=False):
+    """分句流水线：第 N 句播放的同时合成第 N+1 句"""
+    print(f'分句播放，共{len(sentences)}句')
+    ready = queue.Queue(maxsize=1)
+    cancelled = threading.Event()
+
+    def synthesize_all():
+        try:
+            for sentence in sentences:
+                if cancelled.is_set():
+                    break
+                ready.put(prepare_playback(sentence, fish_failed))
+        except Exception as e:
+            print(f'分句合成出错: {e}')
+        finally:
+            ready.put(None)
+
+    threading.Thread(target=latency_trace.bind(synthesize_all), daemon=True).start()
+    for play, priority in iter(ready.get, None):
+        if not schedule_playback(play, priority, text):
+            # 被打断或被丢弃时放弃剩余的句子
+            print('分句播放已取消')
+            cancelled.set()
+            while ready.get() is not None:
+                pass
+            return
 
 def process_text_to_speech(text):
+    """处理文本转语音，处理期间后台预热暂停"""
+    with prewarmer.interactive(), latency_trace.utterance(text):
+        speak(text)
+
+def speak(text):
     """处理文本转语音的核心逻辑"""
-    global device_id, volume, ap, tts_engine
+    global device_id, volume, ap, tts_engine, fish_streaming, api_stream_url, local_library
     # play_wav('./temp/test_converted.wav', device_id, volume)
-    # 查询{text}.wav是否在local目录下出现
-    if os.path.exists(f'./local/{text}.wav'):
-        print(f'查询到{text}.wav')
-        ap.play_audio_on_device(f'./local/{text}.wav', device_id, volume)
+    # 整段文本是本地片段或已缓存时直接播放（缓存命中率按消息在这里统计一次）
+    if local_library.lookup(text) or get_cached_tts(text, './temp', tts_engine, count_lookup=True):
+        play, priority = prepare_playback(text)
+        schedule_playback(play, priority, text)
         print('播放完成')
+        return
+    print(f'未查询到{text}.wav')
+    fish_failed = False
+    # Fish Audio 流式模式: 边合成边播放
+    if tts_engine == 'fish_audio_tts' and fish_streaming and FISH_AUDIO_AVAILABLE:
+        if fish_audio_tts_stream(text, ap, device_id, volume,
+                                 schedule=lambda play: schedule_playback(play, PRIORITY_SYNTH, text)):
+            print('播放完成')
+            return
+        # 流式合成失败说明 Fish Audio 当前不可用，直接使用回退引擎，不再重复请求
+        print('Fish Audio 流式播放失败，使用回退引擎')
+        fish_failed = True
+    # 本地 API 提供流式接口时同样边合成边播放
+    if tts_engine == 'api_tts' and api_stream_url:
+        if http_tts_stream(text, ap, device_id, volume, api_stream_url, tts_engine='api_tts',
+                           schedule=lambda play: schedule_playback(play, PRIORITY_SYNTH, text)):
+            print('播放完成')
+            return
+        print('API 流式播放失败，回退到文件模式')
+    # 多句文本分句合成，第一句合成完成即开始播放
+    sentences = split_sentences(text) if sentence_pipeline else [text]
+    if len(sentences) > 1:
+        play_pipelined(text, sentences, fish_failed)
     else:
-        print(f'未查询到{text}.wav')
-        # 合成
-        path = tts_if_not_exists(text, './temp', tts_engine)
-        print(f'音频合成{path}')
-        ap.play_audio_on_device(path, device_id, volume)
-        print('播放完成')
+        play, priority = prepare_playback(text, fish_failed)
+        schedule_playback(play, priority, text)
+    print('播放完成')
+
+def prewarm_phrase(text):
+    """把一条常用语句合成到磁盘缓存，并解码到内存中的 PCM 缓存"""
+    local_clip = local_library.lookup(text)
+    if local_clip:
+        ap.load_audio(local_clip, device_id, volume)
+        return
+    path = tts_if_not_exists(text, './temp', tts_engine)
+    ap.load_audio(path, device_id, volume, get_cached_loudness(text, './temp', tts_engine))
+
+def create_prewarmer():
+    """读取 PREWARM_FILE 中的常用语句"""
+    phrases = []
+    prewarm_file = setting_dict.get('PREWARM_FILE', '').strip()
+    if prewarm_file:
+        try:
+            phrases = read_lines(prewarm_file)
+            print(f'预热列表: {prewarm_file}, 共{len(phrases)}条')
+        except OSError as e:
+            print(f'读取预热列表失败: {e}')
+    return CachePrewarmer(phrases, prewarm_phrase)
+
+def print_latency_stats():
+    """输出各阶段耗时的分位数"""
+    stats = latency_trace.tracer.stats()
+    if not stats:
+        return
+    print('各阶段耗时 (ms)    p50      p95      p99   次数')
+    for stage, item in stats.items():
+        print(f"{stage:<18}{item['p50']:>7.0f}  {item['p95']:>7.0f}  {item['p99']:>7.0f}  {item['count']:>5}")
+
+def stop_playback():
+    """打断当前播放并清空播放队列"""
+    print('停止播放')
+    scheduler.stop_all()
 
 def core_async():
     threading.Thread(target=core, daemon=True).start()
@@ -112,6 +257,11 @@ def registerGlobalHotKey():
         floating_keys = set(setting_dict['FLOATING_INPUT'].split(sep))
         global_hot_key.register(floating_keys, show_floating_input)
 
+    # 注册停止播放热键
+    if 'STOP_PLAYBACK' in setting_dict:
+        stop_keys = set(setting_dict['STOP_PLAYBACK'].split(sep))
+        global_hot_key.register(stop_keys, stop_playback)
+
 def start_fish_audio_service():
     """启动 Fish Audio 服务"""
     global tts_engine
@@ -147,9 +297,21 @@ def cleanup_and_exit():
     
     print("\n正在清理资源...")
     try:
+        if 'prewarmer' in globals() and prewarmer:
+            prewarmer.stop()
         stop_fish_audio_service()
+        print_latency_stats()
+        # 等待后台缓存写入并保存缓存的访问记录
+        wait_cache_writes()
+        get_tts_cache('./temp').flush()
+        close_pyttsx3_worker()
         if 'floating_input' in globals() and floating_input:
-            floating_input.hide()
+            floating_input.close()
+        if 'local_library' in globals() and local_library:
+            local_library.stop()
+        if 'scheduler' in globals() and scheduler:
+            scheduler.close()
+        ap.close()
         if 'global_hot_key' in globals() and global_hot_key:
             global_hot_key.delete()
         if 'sys_icon' in globals() and sys_icon:
@@ -199,32 +361,64 @@ if __name__ == '__main__':
         
         # 确保工作路径正确
         checkPath()
-        global setting_dict, global_hot_key, device_id, volume, tts_engine, sys_icon, floating_input
+        global setting_dict, global_hot_key, device_id, volume, tts_engine, fish_streaming, api_stream_url, sys_icon, floating_input, local_library
+        global scheduler, playback_interrupt, sentence_pipeline, prewarmer
         # 读取设置
         setting_dict = getConfigDict()
+        # 延迟追踪：每条消息各阶段的耗时写入轮转的 JSONL 文件
+        latency_trace.tracer.configure(setting_dict.get('LATENCY_TRACE', 'true').lower() == 'true',
+                                       setting_dict.get('LATENCY_TRACE_FILE', './temp/latency.jsonl'))
+        # 播放调度器：所有播放请求按优先级排队，新消息可以打断正在播放的旧消息
+        scheduler = PlaybackScheduler(ap,
+                                      max_queue=int(setting_dict.get('PLAYBACK_QUEUE_MAX', '4')),
+                                      max_wait=float(setting_dict.get('PLAYBACK_MAX_WAIT', '10')))
+        playback_interrupt = setting_dict.get('PLAYBACK_INTERRUPT', 'false').lower() == 'true'
+        # 建立本地片段索引，并在后台跟踪 ./local 目录的变化
+        local_library = LocalClipLibrary('./local', float(setting_dict.get('LOCAL_POLL_INTERVAL', '2')))
+        local_library.start()
+        # 常用语句预热任务，引擎启动后再开始
+        prewarmer = create_prewarmer()
         # 注册全局热键
         global_hot_key = EnhancedGlobalHotKeyManager()
         registerGlobalHotKey()
         global_hot_key.start()
         volume = float(setting_dict['VOLUME'])
         print(f'音量:{volume}')
+        # 已解码音频的内存缓存预算
+        ap.pcm_cache.max_bytes = int(float(setting_dict.get('PCM_CACHE_MAX_MB', '64')) * 1024 * 1024)
+        # 响度归一化：不同引擎和本地片段统一到相同响度
+        if setting_dict.get('LOUDNESS_NORMALIZE', 'true').lower() == 'true':
+            ap.loudness_target = float(setting_dict.get('LOUDNESS_TARGET', '-18'))
         # 设置输出设备
         if not setting_dict['DEVICE'] in device_dict:
             raise ValueError(
                 f"指定设备:{setting_dict['DEVICE']}不存在,当前设备列表:{device_dict.keys()}")
         device_id = device_dict[setting_dict['DEVICE']]
+        # 预先打开常驻输出流，播放时不再等待设备打开
+        ap.open_device(device_id)
         tts_engine = setting_dict['TTS_ENGINE']
+        fish_streaming = setting_dict.get('FISH_STREAMING', 'false').lower() == 'true'
+        api_stream_url = setting_dict.get('API_STREAM_URL', '').strip()
+        sentence_pipeline = setting_dict.get('SENTENCE_PIPELINE', 'true').lower() == 'true'
         
         # 初始化悬浮输入窗口
         floating_input = FloatingTextInput(floating_input_callback, global_hot_key)
         
         # 启动 Fish Audio 服务（如果需要）
         start_fish_audio_service()
+        # 使用 pyttsx3 时提前初始化引擎，第一条消息不再等待驱动启动
+        if tts_engine == 'pyttsx3_tts':
+            get_pyttsx3_worker()
+        
+        # 引擎就绪后在后台预热常用语句，有交互请求时自动让路
+        prewarmer.start()
         
         print("程序已启动，按 Ctrl+C 或 Ctrl+Break 退出")
         print(f"剪贴板读取热键: {setting_dict['ACTIVATION']}")
         if 'FLOATING_INPUT' in setting_dict:
             print(f"悬浮窗输入热键: {setting_dict['FLOATING_INPUT']}")
+        if 'STOP_PLAYBACK' in setting_dict:
+            print(f"停止播放热键: {setting_dict['STOP_PLAYBACK']}")
         
         # 创建托盘图标，传递清理回调函数
         sys_icon = SystemTrayIcon(cleanup_callback=cleanup_and_exit)
@@ -0,0 +1,177 @@
+"""
+AudioPlayer 基准测试
+使用 NullBackend 代替声卡，在不同时长（0.5 秒到 5 分钟）和采样格式的片段上测量
+WAV 读取、音量调整、格式转换、输出流建立和打断播放的耗时，以及加载时的内存峰值。
+可以在没有声卡的 Linux 机器上运行，用来发现播放器的性能退化。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.audio_player_bench
+    python -m benchmarks.audio_player_bench --durations 0.5 30 --formats 44100/1 48000/2 --repeat 5 --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+from Util.AudioPlayer import AudioPlayer
+from Util.audio_backend import NullBackend
+
+DEFAULT_DURATIONS = (0.5, 5.0, 30.0, 300.0)
+DEFAULT_FORMATS = ('22050/1', '44100/1', '44100/2', '48000/2')
+DEVICE_ID = 0
+
+
+def parse_format(text):
+    rate, channels = text.split('/')
+    return int(rate), int(channels)
+
+
+def write_clip(path, duration, rate, channels):
+    """生成带少量噪声的正弦波片段"""
+    frames = int(duration * rate)
+    t = np.arange(frames) / rate
+    signal = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.01 * np.random.default_rng(0).standard_normal(frames)
+    data = np.repeat((signal * 32767).astype(np.int16)[:, None], channels, axis=1)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(data.tobytes())
+
+
+def timed(fn, repeat):
+    """多次执行取中位数（毫秒），返回 (耗时, 最后一次的结果)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wf:
+        return wf.readframes(wf.getnframes()), wf.getframerate(), wf.getnchannels()
+
+
+def measure_interrupt(player, audio_data, rate, channels, play_for=0.05):
+    """播放 play_for 秒后打断，返回从打断到 play 返回的耗时（毫秒）"""
+    thread = threading.Thread(target=player.play, args=(audio_data, rate, DEVICE_ID, channels))
+    thread.start()
+    time.sleep(play_for)
+    start = time.perf_counter()
+    player.interrupt()
+    thread.join()
+    elapsed = (time.perf_counter() - start) * 1000
+    player.reset_interrupt()
+    return elapsed
+
+
+def bench_clip(path, duration, rate, channels, args) -> dict:
+    device_rate, device_channels = args.device_rate, args.device_channels
+    backend = NullBackend(device_rate, device_channels, blocksize=args.blocksize)
+    player = AudioPlayer(backend=backend, loudness_target=args.loudness)
+    volume = 0.8
+
+    read_ms, (frames, _, _) = timed(lambda: read_wav(path), args.repeat)
+    gain_ms, audio_data = timed(lambda: player.prepare_pcm(frames, volume, rate, channels), args.repeat)
+    convert_ms, adapted = timed(lambda: player.adapt(audio_data, rate, channels, DEVICE_ID), args.repeat)
+
+    def cold_load():
+        player.pcm_cache.clear()
+        player.loudness_cache.clear()
+        return player.load_audio(path, DEVICE_ID, volume)
+    load_ms, _ = timed(cold_load, args.repeat)
+    cached_ms, _ = timed(lambda: player.load_audio(path, DEVICE_ID, volume), args.repeat)
+
+    def setup():
+        fresh = AudioPlayer(backend=backend)
+        fresh.open_device(DEVICE_ID)
+        return fresh
+    setup_times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        fresh = setup()
+        setup_times.append((time.perf_counter() - start) * 1000)
+        fresh.close()
+    setup_ms = statistics.median(setup_times)
+
+    interrupt_ms = statistics.median(
+        measure_interrupt(player, adapted, device_rate, device_channels) for _ in range(args.repeat))
+    player.close()
+
+    # 单独测量内存，tracemalloc 会拖慢分配，不与计时混在一起
+    player.pcm_cache.clear()
+    player.loudness_cache.clear()
+    tracemalloc.start()
+    player.load_audio(path, DEVICE_ID, volume)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'duration': duration,
+        'format': f'{rate}/{channels}',
+        'device_format': f'{device_rate}/{device_channels}',
+        'read_ms': round(read_ms, 3),
+        'gain_ms': round(gain_ms, 3),
+        'convert_ms': round(convert_ms, 3),
+        'load_ms': round(load_ms, 3),
+        'cached_load_ms': round(cached_ms, 3),
+        'stream_setup_ms': round(setup_ms, 3),
+        'interrupt_ms': round(interrupt_ms, 3),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+    }
+
+
+def format_table(results) -> str:
+    header = (f"{'时长(s)':>8} {'格式':>8} {'读取':>9} {'增益':>9} {'转换':>9} {'加载':>9} "
+              f"{'缓存命中':>9} {'打开流':>9} {'打断':>9} {'峰值MB':>8}")
+    lines = ['耗时单位为毫秒（中位数）', header]
+    for r in results:
+        lines.append(f"{r['duration']:>8g} {r['format']:>8} {r['read_ms']:>9.2f} {r['gain_ms']:>9.2f} "
+                     f"{r['convert_ms']:>9.2f} {r['load_ms']:>9.2f} {r['cached_load_ms']:>9.3f} "
+                     f"{r['stream_setup_ms']:>9.2f} {r['interrupt_ms']:>9.2f} {r['peak_mb']:>8.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='使用模拟输出设备对 AudioPlayer 进行基准测试')
+    parser.add_argument('--durations', type=float, nargs='+', default=DEFAULT_DURATIONS, help='片段时长（秒）')
+    parser.add_argument('--formats', nargs='+', default=DEFAULT_FORMATS, help='片段格式，采样率/声道数')
+    parser.add_argument('--device-rate', type=int, default=48000, help='模拟设备的采样率')
+    parser.add_argument('--device-channels', type=int, default=2, help='模拟设备的声道数')
+    parser.add_argument('--blocksize', type=int, default=512, help='模拟设备每次回调的帧数')
+    parser.add_argument('--loudness', type=float, default=None, help='目标响度(LUFS)，指定时加载包含响度测量')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测量的重复次数')
+    parser.add_argument('--json', action='store_true', help='每个片段输出一行 JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for duration in args.durations:
+            for fmt in args.formats:
+                rate, channels = parse_format(fmt)
+                path = os.path.join(temp_dir, f'clip_{duration:g}s_{rate}_{channels}.wav')
+                write_clip(path, duration, rate, channels)
+                result = bench_clip(path, duration, rate, channels, args)
+                os.remove(path)
+                results.append(result)
+                if args.json:
+                    print(json.dumps(result, ensure_ascii=False), flush=True)
+    if not args.json:
+        print(format_table(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+Fish Audio 服务基准测试
+在本地启动一个模拟 Fish Audio 实时合成协议的 WebSocket 服务（msgpack 编码的
+start/text/flush/stop -> audio/finish），让 fish_audio_server 连接它，
+再按指定并发向 tts_endpoint 发送请求，统计吞吐量和延迟分位数。
+不需要 API Key 和网络，可以用来比较连接池、流式和缓存相关改动前后的数据。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.fish_server_bench --requests 200 --concurrency 8
+    python -m benchmarks.fish_server_bench --first-chunk-delay 0.3 --chunk-size 4096 --jitter 0.2 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import ormsgpack as msgpack
+import requests
+from websockets.asyncio.server import serve
+from werkzeug.serving import make_server
+
+from Util import fish_audio_server
+from Util.latency_trace import percentile
+
+
+class FakeFishAudio:
+    """本地模拟的 Fish Audio WebSocket 服务
+
+    每个会话在收到 flush 或 stop 后返回 audio_bytes 字节的音频：等待 first_chunk_delay
+    秒后发出第一块，之后每 chunk_interval 秒发出 chunk_size 字节，stop 后以 finish 结束。
+    jitter 为各段等待时间的随机浮动比例（0.2 表示 ±20%）。
+    """
+
+    def __init__(self, first_chunk_delay=0.3, chunk_size=4096, chunk_interval=0.02,
+                 jitter=0.0, audio_bytes=88200, seed=None):
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_size = chunk_size
+        self.chunk_interval = chunk_interval
+        self.jitter = jitter
+        self.audio_bytes = audio_bytes
+        self.random = random.Random(seed)
+        self.connections = 0
+        self.sessions = 0
+        self.url = None
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+
+    def _delay(self, seconds):
+        if self.jitter:
+            seconds *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(seconds, 0)
+
+    def _payload(self, request):
+        """按请求的格式生成静音音频；压缩格式只模拟数据量"""
+        audio_format = request.get('format', 'opus')
+        if audio_format != 'wav':
+            return bytes(self.audio_bytes)
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(request.get('sample_rate') or 44100)
+            wf.writeframes(bytes(self.audio_bytes))
+        return buffer.getvalue()
+
+    async def _send_audio(self, websocket, request):
+        self.sessions += 1
+        payload = self._payload(request)
+        await asyncio.sleep(self._delay(self.first_chunk_delay))
+        for start in range(0, len(payload), self.chunk_size):
+            if start:
+                await asyncio.sleep(self._delay(self.chunk_interval))
+            await websocket.send(msgpack.packb({'event': 'audio', 'audio': payload[start:start + self.chunk_size]}))
+
+    async def handler(self, websocket):
+        """一条连接上可以先后进行多个会话（连接池复用连接）"""
+        self.connections += 1
+        request = {}
+        pending_text = False
+        async for raw in websocket:
+            message = msgpack.unpackb(raw)
+            event = message.get('event')
+            if event == 'start':
+                request = message.get('request', {})
+                pending_text = False
+            elif event == 'text':
+                pending_text = pending_text or bool(message.get('text', '').strip())
+            elif event in ('flush', 'stop'):
+                if pending_text:
+                    await self._send_audio(websocket, request)
+                    pending_text = False
+                if event == 'stop':
+                    await websocket.send(msgpack.packb({'event': 'finish', 'reason': 'stop'}))
+
+    async def _serve(self, host, port, ready):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        async with serve(self.handler, host, port, max_size=None) as server:
+            self.url = f"ws://{host}:{server.sockets[0].getsockname()[1]}"
+            ready.set()
+            await self.stopped.wait()
+
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程中启动，返回 WebSocket 地址"""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve(host, port, ready)),
+                                       name='fake-fish-audio', daemon=True)
+        self.thread.start()
+        if not ready.wait(5):
+            raise RuntimeError("模拟服务启动失败")
+        return self.url
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(5)
+
+
+def run_requests(url, texts, concurrency, file_type):
+    """按并发数发送请求，返回 (每个请求的耗时秒数, 失败数, 总耗时秒数)"""
+    local = threading.local()
+
+    def one(text):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json={'text': text, 'file_type': file_type}, timeout=60)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, texts))
+    elapsed = time.perf_counter() - start_time
+    latencies = sorted(seconds for seconds, ok in results if ok)
+    return latencies, sum(1 for _, ok in results if not ok), elapsed
+
+
+def summarize(latencies, failed, elapsed, fake: FakeFishAudio, args) -> dict:
+    ms = [seconds * 1000 for seconds in latencies]
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'distinct': args.distinct or args.requests,
+        'format': args.format,
+        'ok': len(latencies),
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / max(elapsed, 1e-9), 2),
+        'mean_ms': round(sum(ms) / len(ms), 2) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p95_ms': round(percentile(ms, 95), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'max_ms': round(ms[-1], 2) if ms else 0.0,
+        'upstream_connections': fake.connections,
+        'upstream_sessions': fake.sessions,
+    }
+
+
+def format_summary(result) -> str:
+    return '\n'.join([
+        f"请求 {result['requests']} 条 (并发 {result['concurrency']}, 不同文本 {result['distinct']} 条, "
+        f"格式 {result['format']}): 成功 {result['ok']}, 失败 {result['failed']}",
+        f"耗时 {result['seconds']:.2f} 秒, 吞吐量 {result['throughput']:.2f} 请求/秒",
+        f"延迟 (ms): 平均 {result['mean_ms']:.1f}, p50 {result['p50_ms']:.1f}, p95 {result['p95_ms']:.1f}, "
+        f"p99 {result['p99_ms']:.1f}, 最大 {result['max_ms']:.1f}",
+        f"模拟服务: 建立连接 {result['upstream_connections']} 次, 合成会话 {result['upstream_sessions']} 次",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='使用本地模拟服务对 Fish Audio 服务端进行基准测试')
+    parser.add_argument('--requests', type=int, default=100, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发请求数')
+    parser.add_argument('--distinct', type=int, default=0, help='不同文本的数量，默认每个请求的文本都不同')
+    parser.add_argument('--format', default='wav', choices=fish_audio_server.SUPPORTED_FORMATS, help='请求的音频格式')
+    parser.add_argument('--warmup', type=int, default=4, help='正式计时前的预热请求数')
+    parser.add_argument('--pool-size', type=int, default=None, help='连接池大小，默认使用配置中的 FISH_POOL_SIZE')
+    parser.add_argument('--first-chunk-delay', type=float, default=0.3, help='模拟服务返回第一块音频前的等待（秒）')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='模拟服务每块音频的字节数')
+    parser.add_argument('--chunk-interval', type=float, default=0.02, help='模拟服务相邻两块音频的间隔（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='等待时间的随机浮动比例，如 0.2 表示 ±20%%')
+    parser.add_argument('--audio-bytes', type=int, default=88200, help='每次合成返回的音频字节数')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--verbose', action='store_true', help='显示服务端日志')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    fake = FakeFishAudio(args.first_chunk_delay, args.chunk_size, args.chunk_interval,
+                         args.jitter, args.audio_bytes, args.seed)
+    service = fish_audio_server.fish_service
+    service.pool.url = fake.start()
+    if args.pool_size is not None:
+        service.pool.size = args.pool_size
+
+    distinct = args.distinct or args.requests
+    texts = [f"基准测试第 {i % distinct} 句，用于测量合成服务的延迟。" for i in range(args.requests)]
+    warmup = [f"预热请求 {i}" for i in range(args.warmup)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 合成结果写到临时目录，测试结束后删除
+        service.temp_dir = temp_dir
+        server = make_server('127.0.0.1', 0, fish_audio_server.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/"
+
+        quiet = open(os.devnull, 'w', encoding='utf-8')
+        try:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+                service.start()
+                if warmup:
+                    run_requests(url, warmup, args.concurrency, args.format)
+                fake.connections = fake.sessions = 0
+                latencies, failed, elapsed = run_requests(url, texts, args.concurrency, args.format)
+        finally:
+            server.shutdown()
+            with contextlib.redirect_stdout(quiet):
+                service.close()
+            fake.stop()
+            quiet.close()
+
+    result = summarize(latencies, failed, elapsed, fake, args)
+    print(json.dumps(result, ensure_ascii=False) if args.json else format_summary(result))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())